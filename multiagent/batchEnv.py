@@ -0,0 +1,286 @@
+# batchEnv.py
+# -----------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+A batch of classic Pacman games stepped together with NumPy.
+
+The games follow the rules in pacman.py (PacmanRules and GhostRules) and
+are kept in arrays:
+
+  positions     (N, agents, 2) ints, in half grid units, so that scared
+                ghosts moving at half speed stay exact
+  directions    (N, agents) indices into ACTIONS
+  scaredTimers  (N, agents)
+  food          (N, width * height) bools, indexed by x * height + y
+  capsules      (N, len(layout.capsules)) bools
+  scores, wins, loses (N,)
+
+Actions are indices into ACTIONS.  NumPy is only needed by this module.
+
+> python batchEnv.py
+
+checks the batch against GameState.generateSuccessor on the bundled layouts.
+"""
+
+from game import Directions
+from game import Actions
+from pacman import GameState, SCARED_TIME, TIME_PENALTY, COLLISION_TOLERANCE
+import layout
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+ACTION_INDEX = dict([(action, i) for i, action in enumerate(ACTIONS)])
+STOP = ACTION_INDEX[Directions.STOP]
+
+class BatchPacmanEnv:
+    """
+    N games on one layout.  stepAgent moves one agent in every game, as
+    GameState.generateSuccessor does; step plays a whole round, with the
+    ghosts choosing uniformly among their legal actions like RandomGhost.
+    Finished games stay as they are until reset, or are reset by step
+    itself when autoReset is set.
+    """
+
+    def __init__( self, layout, numGames, numGhosts=None, autoReset=True, seed=None ):
+        if numpy is None:
+            raise Exception('BatchPacmanEnv requires NumPy')
+        if numGhosts == None: numGhosts = layout.getNumGhosts()
+        self.layout = layout
+        self.numGames = numGames
+        self.autoReset = autoReset
+        self.random = numpy.random.RandomState(seed)
+
+        initState = GameState()
+        initState.initialize( layout, numGhosts )
+        self.numAgents = initState.getNumAgents()
+        self.width, self.height = layout.width, layout.height
+        self.vectors = numpy.array([Actions.directionToVector(action) for action in ACTIONS], dtype=numpy.int32)
+        self.reverse = numpy.array([ACTION_INDEX[Actions.reverseDirection(action)] for action in ACTIONS])
+        self.capsuleCells = numpy.array([x * self.height + y for x, y in layout.capsules], dtype=numpy.int32)
+
+        # legal action masks at every grid point
+        if layout.actionTable == None: layout.initializeActionTable()
+        pacmanActions, ghostActions = layout.actionTable
+        numCells = self.width * self.height
+        self.pacmanLegal = numpy.zeros((numCells, len(ACTIONS)), dtype=bool)
+        self.ghostLegal = numpy.zeros((numCells, len(ACTIONS), len(ACTIONS)), dtype=bool)
+        for cell in range(numCells):
+            if pacmanActions[cell] == None: continue
+            for action in pacmanActions[cell]:
+                self.pacmanLegal[cell, ACTION_INDEX[action]] = True
+            for direction, legal in ghostActions[cell].items():
+                for action in legal:
+                    self.ghostLegal[cell, ACTION_INDEX[direction], ACTION_INDEX[action]] = True
+
+        self.initial = encodeState( initState, layout )
+        self.positions = numpy.zeros((numGames, self.numAgents, 2), dtype=numpy.int32)
+        self.directions = numpy.zeros((numGames, self.numAgents), dtype=numpy.int32)
+        self.scaredTimers = numpy.zeros((numGames, self.numAgents), dtype=numpy.int32)
+        self.food = numpy.zeros((numGames, numCells), dtype=bool)
+        self.capsules = numpy.zeros((numGames, len(layout.capsules)), dtype=bool)
+        self.scores = numpy.zeros(numGames, dtype=numpy.int32)
+        self.wins = numpy.zeros(numGames, dtype=bool)
+        self.loses = numpy.zeros(numGames, dtype=bool)
+        self.reset()
+
+    def reset( self, games=None ):
+        """
+        Puts the given games (all of them by default; an index array or
+        boolean mask) back in the layout's initial state.
+        """
+        if games is None: games = slice(None)
+        positions, directions, scaredTimers, food, capsules, score, win, lose = self.initial
+        self.positions[games] = positions
+        self.directions[games] = directions
+        self.scaredTimers[games] = scaredTimers
+        self.food[games] = food
+        self.capsules[games] = capsules
+        self.scores[games] = score
+        self.wins[games] = win
+        self.loses[games] = lose
+
+    def isDone( self ):
+        return self.wins | self.loses
+
+    def getLegalActionMask( self, agentIndex ):
+        """
+        Returns an (N, len(ACTIONS)) boolean array of each game's legal
+        actions for the agent; finished games have none.
+        """
+        x2, y2 = self.positions[:, agentIndex, 0], self.positions[:, agentIndex, 1]
+        onGrid = ((x2 | y2) & 1) == 0
+        cells = numpy.where(onGrid, (x2 // 2) * self.height + y2 // 2, 0)
+        if agentIndex == 0:
+            legal = self.pacmanLegal[cells]
+        else:
+            directions = self.directions[:, agentIndex]
+            legal = self.ghostLegal[cells, directions]
+            # between grid points a ghost can only keep going
+            legal[~onGrid] = numpy.arange(len(ACTIONS)) == directions[~onGrid, None]
+        legal[self.isDone()] = False
+        return legal
+
+    def stepAgent( self, agentIndex, actions ):
+        """
+        Moves the agent in every unfinished game by the given actions (an
+        array of N action indices; finished games ignore theirs) and
+        returns the change in each game's score.
+        """
+        actions = numpy.asarray(actions)
+        active = ~self.isDone()
+        legal = self.getLegalActionMask(agentIndex)
+        if not legal[active, actions[active]].all():
+            raise Exception('Illegal action for agent %d' % agentIndex)
+        scoreChange = numpy.zeros(self.numGames, dtype=numpy.int32)
+        games = numpy.arange(self.numGames)[active]
+        actions = actions[active]
+
+        # move: positions are in half units, so a full step is two
+        speed = 2
+        if agentIndex > 0:
+            speed = numpy.where(self.scaredTimers[games, agentIndex] > 0, 1, 2)[:, None]
+        self.positions[games, agentIndex] += self.vectors[actions] * speed
+        moved = actions != STOP
+        self.directions[games[moved], agentIndex] = actions[moved]
+
+        if agentIndex == 0:
+            # Pacman is always on a grid point: eat food and capsules there
+            cells = (self.positions[games, 0, 0] // 2) * self.height + self.positions[games, 0, 1] // 2
+            ate = self.food[games, cells]
+            eaters = games[ate]
+            self.food[eaters, cells[ate]] = False
+            scoreChange[eaters] += 10
+            cleared = eaters[~self.food[eaters].any(axis=1) & ~self.loses[eaters]]
+            scoreChange[cleared] += 500
+            self.wins[cleared] = True
+            if len(self.capsuleCells) > 0:
+                onCapsule = (self.capsuleCells[None, :] == cells[:, None]) & self.capsules[games]
+                eaters = games[onCapsule.any(axis=1)]
+                self.capsules[games] &= ~onCapsule
+                self.scaredTimers[eaters, 1:] = SCARED_TIME
+            scoreChange[games] -= TIME_PENALTY
+            ghosts = range(1, self.numAgents)
+        else:
+            # time passes: a ghost whose fright ends snaps to the nearest grid point
+            timers = self.scaredTimers[games, agentIndex]
+            ending = games[timers == 1]
+            self.positions[ending, agentIndex] = (self.positions[ending, agentIndex] + 1) // 2 * 2
+            self.scaredTimers[games, agentIndex] = numpy.maximum(0, timers - 1)
+            ghosts = [agentIndex]
+
+        for ghost in ghosts:
+            distance = numpy.abs(self.positions[games, ghost] - self.positions[games, 0]).sum(axis=1)
+            caught = games[distance <= 2 * COLLISION_TOLERANCE]
+            scared = self.scaredTimers[caught, ghost] > 0
+            eaten = caught[scared]
+            scoreChange[eaten] += 200
+            self.positions[eaten, ghost] = self.initial[0][ghost]
+            self.directions[eaten, ghost] = self.initial[1][ghost]
+            self.scaredTimers[eaten, ghost] = 0
+            killers = caught[~scared]
+            killers = killers[~self.wins[killers]]
+            scoreChange[killers] -= 500
+            self.loses[killers] = True
+
+        self.scores += scoreChange
+        return scoreChange
+
+    def step( self, actions ):
+        """
+        Plays one round in every unfinished game: Pacman takes the given
+        actions, then each ghost a random legal action.  Returns the change
+        in each game's score and which games ended this round.  With
+        autoReset the games that ended are then reset.
+        """
+        active = ~self.isDone()
+        rewards = self.stepAgent(0, actions)
+        for ghost in range(1, self.numAgents):
+            legal = self.getLegalActionMask(ghost)
+            choices = numpy.zeros(self.numGames, dtype=numpy.int32)
+            playing = legal.any(axis=1)
+            if playing.any():
+                # pick uniformly among each game's legal actions
+                weights = self.random.random_sample(legal.shape) * legal
+                choices[playing] = weights[playing].argmax(axis=1)
+            rewards += self.stepAgent(ghost, choices)
+        dones = active & self.isDone()
+        if self.autoReset: self.reset(dones)
+        return rewards, dones
+
+def encodeState( state, layout ):
+    """
+    Returns a GameState as the arrays BatchPacmanEnv keeps for one game.
+    """
+    agentStates = state.data.agentStates
+    positions = numpy.array([[int(2 * c) for c in s.configuration.getPosition()] for s in agentStates], dtype=numpy.int32)
+    directions = numpy.array([ACTION_INDEX[s.configuration.getDirection()] for s in agentStates], dtype=numpy.int32)
+    scaredTimers = numpy.array([s.scaredTimer for s in agentStates], dtype=numpy.int32)
+    food = numpy.zeros(layout.width * layout.height, dtype=bool)
+    for x, y in state.getFood().asList():
+        food[x * layout.height + y] = True
+    capsules = numpy.array([c in state.getCapsules() for c in layout.capsules], dtype=bool)
+    return positions, directions, scaredTimers, food, capsules, state.getScore(), state.isWin(), state.isLose()
+
+def checkParity( layoutName, numGames=8, numMoves=2000, seed=0 ):
+    """
+    Plays random games with GameState.generateSuccessor and the batch side
+    by side, and checks that their legal actions and states agree after
+    every move.  Returns the number of moves checked.
+    """
+    lay = layout.getLayout( layoutName )
+    env = BatchPacmanEnv( lay, numGames, autoReset=False )
+    rand = random.Random( seed )
+    states = []
+    for n in range(numGames):
+        state = GameState()
+        state.initialize( lay, env.numAgents - 1 )
+        states.append( state )
+    checked = 0
+    agentIndex = 0
+    for move in range(numMoves):
+        legal = env.getLegalActionMask( agentIndex )
+        actions = numpy.zeros(numGames, dtype=numpy.int32)
+        for n in range(numGames):
+            expected = [ACTION_INDEX[a] for a in states[n].getLegalActions( agentIndex )]
+            if sorted(expected) != list(numpy.nonzero(legal[n])[0]):
+                raise Exception('%s: legal actions differ in game %d at move %d' % (layoutName, n, move))
+            action = rand.choice( states[n].getLegalActions( agentIndex ) )
+            states[n] = states[n].generateSuccessor( agentIndex, action )
+            actions[n] = ACTION_INDEX[action]
+        env.stepAgent( agentIndex, actions )
+        for n in range(numGames):
+            expected = encodeState( states[n], lay )
+            actual = (env.positions[n], env.directions[n], env.scaredTimers[n], env.food[n],
+                      env.capsules[n], env.scores[n], env.wins[n], env.loses[n])
+            for a, b in zip(expected, actual):
+                if not numpy.array_equal(a, b):
+                    raise Exception('%s: states differ in game %d at move %d' % (layoutName, n, move))
+            if states[n].isWin() or states[n].isLose():
+                states[n] = GameState()
+                states[n].initialize( lay, env.numAgents - 1 )
+                env.reset( [n] )
+            checked += 1
+        agentIndex = (agentIndex + 1) % env.numAgents
+    return checked
+
+if __name__ == '__main__':
+    import os
+    for name in sorted(os.listdir('layouts')):
+        if not name.endswith('.lay'): continue
+        print name[:-4], checkParity( name[:-4] ), 'moves agree'
@@ -21,9 +21,10 @@
 # For more info, see http://inst.eecs.berkeley.edu/~cs188/sp09/pacman.html
 
 from util import *
-import time, os
+import time, os, random
 import traceback
 import sys
+import binascii, itertools, string, struct
 
 #######################
 # Parts worth reading #
@@ -61,13 +62,25 @@ class Directions:
 
     RIGHT =      dict([(y,x) for x, y in LEFT.items()])
 
+    # a small integer for each direction, for binary formats
+    CODES = [NORTH, SOUTH, EAST, WEST, STOP]
+    CODE = dict([(d, i) for i, d in enumerate(CODES)])
+
     REVERSE = {NORTH: SOUTH,
                SOUTH: NORTH,
                EAST: WEST,
                WEST: EAST,
                STOP: STOP}
 
-class Configuration:
+def getSlotState(self):
+    "__getstate__ for the slotted state classes, so every pickle protocol works"
+    return dict([(name, getattr(self, name)) for name in self.__slots__ if hasattr(self, name)])
+
+def setSlotState(self, state):
+    for name, value in state.items():
+        setattr(self, name, value)
+
+class Configuration(object):
     """
     A Configuration holds the (x,y) coordinate of a character, along with its
     traveling direction.
@@ -75,10 +88,14 @@ class Configuration:
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
     """
+    __slots__ = ('pos', 'direction', 'cell')
+    __getstate__ = getSlotState
+    __setstate__ = setSlotState
 
-    def __init__(self, pos, direction):
+    def __init__(self, pos, direction, cell=None):
         self.pos = pos
         self.direction = direction
+        self.cell = cell # the layout's integer cell id for pos, once known (see Layout.getCell)
 
     def getPosition(self):
         return (self.pos)
@@ -117,10 +134,13 @@ class Configuration:
             direction = self.direction # There is no stop direction
         return Configuration((x + dx, y+dy), direction)
 
-class AgentState:
+class AgentState(object):
     """
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
     """
+    __slots__ = ('start', 'configuration', 'isPacman', 'scaredTimer', 'numCarrying', 'numReturned')
+    __getstate__ = getSlotState
+    __setstate__ = setSlotState
 
     def __init__( self, startConfiguration, isPacman ):
         self.start = startConfiguration
@@ -183,6 +203,10 @@ class Grid:
     def __setitem__(self, key, item):
         self.data[key] = item
 
+    def get(self, x, y):
+        "Cell (x,y): grid[x][y]"
+        return self.data[x][y]
+
     def __str__(self):
         out = [[str(self.data[x][y])[0] for x in range(self.width)] for y in range(self.height)]
         out.reverse()
@@ -190,6 +214,7 @@ class Grid:
 
     def __eq__(self, other):
         if other == None: return False
+        if isinstance(other, BitGrid): return other == self
         return self.data == other.data
 
     def __hash__(self):
@@ -231,48 +256,235 @@ class Grid:
         Returns an efficient int list representation
 
         (width, height, bitPackedInts...)
+
+        Each int packs CELLS_PER_INT cells, in the order x * height + y, the
+        first of them in its most significant bit.
+        """
+        cells = self._cellString()
+        size = self.CELLS_PER_INT
+        chunks = [int(cells[i:i + size].ljust(size, '0'), 2) for i in range(0, len(cells) + 1, size)]
+        return tuple([self.width, self.height] + chunks)
+
+    def _cellString(self):
+        "The cells' truth values as a string of '0's and '1's in the order x * height + y"
+        return str(bytearray(map(bool, itertools.chain(*self.data)))).translate(_BYTES_TO_DIGITS)
+
+    def _setCellString(self, cells):
+        "Sets the leading cells from a string of '0's and '1's (see _cellString)"
+        values = map(bool, bytearray(cells.translate(_DIGITS_TO_BYTES)))
+        height = self.height
+        if height and len(values) >= self.width * height:
+            self.data = [values[i:i + height] for i in range(0, self.width * height, height)]
+            return
+        for x in range(self.width):
+            column = values[x * height:(x + 1) * height]
+            self.data[x][:len(column)] = column
+
+    def _unpackBits(self, bits):
+        """
+        Fills in data from a bit-level representation
+        """
+        for packed in bits:
+            if packed < 0: raise ValueError, "must be a positive integer"
+        self._setCellString(''.join([bin(packed)[2:].zfill(self.CELLS_PER_INT) for packed in bits]))
+
+    def toBytes(self):
+        """
+        Returns the grid in the binary grid format (see gridBytes), which
+        like packBits keeps only the truth of each cell.
+        """
+        cells = self._cellString()
+        bits = 0
+        if cells: bits = int(cells[::-1], 2)
+        return gridBytes(self.width, self.height, bits)
+
+    def fromBytes(data):
+        """
+        Reads a Grid written by Grid.toBytes or BitGrid.toBytes
+        """
+        width, height, bits, end = readGridBytes(data)
+        g = Grid(width, height)
+        if bits: g._setCellString(bin(bits)[2:][::-1].ljust(width * height, '0'))
+        return g
+    fromBytes = staticmethod(fromBytes)
+
+class BitGrid:
+    """
+    A boolean Grid stored as the bits of a single Python int.  Cell (x,y) is
+    bit x * height + y, the cell order packBits already uses, so a BitGrid
+    hashes exactly like the equivalent Grid.
+
+    Data is accessed via grid[x][y] as with Grid.  Writes rebind the int
+    rather than mutating shared storage, so copy() is O(1) and copies never
+    see each other's writes.  count() is a popcount and __eq__ compares ints.
+    """
+    def __init__(self, width, height, initialValue=False, bitRepresentation=None):
+        if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
+        self.CELLS_PER_INT = 30
+
+        self.width = width
+        self.height = height
+        self.bits = 0
+        if initialValue:
+            self.bits = (1 << (width * height)) - 1
+        if bitRepresentation:
+            self._unpackBits(bitRepresentation)
+
+    def fromGrid(grid):
+        g = BitGrid(grid.width, grid.height)
+        for x, y in grid.asList():
+            g.bits |= 1 << (x * grid.height + y)
+        return g
+    fromGrid = staticmethod(fromGrid)
+
+    def __getitem__(self, x):
+        if x < 0: x += self.width
+        if x < 0 or x >= self.width: raise IndexError('BitGrid index out of range')
+        return BitGridColumn(self, x)
+
+    def get(self, x, y):
+        """
+        Cell (x,y) as 1 or 0, read straight from the bits rather than through
+        a BitGridColumn.  Unlike grid[x][y] the indices are not checked, so
+        they must be on the board.
+        """
+        return (self.bits >> (x * self.height + y)) & 1
+
+    def __str__(self):
+        out = [[str(self[x][y])[0] for x in range(self.width)] for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def __eq__(self, other):
+        if other is None: return False
+        if isinstance(other, BitGrid):
+            return self.bits == other.bits and self.width == other.width and self.height == other.height
+        return self.width == other.width and self.height == other.height and \
+               self.asList() == other.asList()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def copy(self):
+        g = BitGrid(self.width, self.height)
+        g.bits = self.bits
+        return g
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        return self.copy()
+
+    def count(self, item =True ):
+        numTrue = bin(self.bits).count('1')
+        if item: return numTrue
+        return self.width * self.height - numTrue
+
+    def asList(self, key = True):
+        bits = self.bits
+        if not key:
+            bits = ~bits & ((1 << (self.width * self.height)) - 1)
+        list = []
+        while bits:
+            lowest = bits & -bits
+            list.append(divmod(lowest.bit_length() - 1, self.height))
+            bits ^= lowest
+        return list
+
+    def packBits(self):
+        """
+        Returns the same (width, height, bitPackedInts...) tuple as Grid.packBits
         """
         bits = [self.width, self.height]
-        currentInt = 0
-        for i in range(self.height * self.width):
-            bit = self.CELLS_PER_INT - (i % self.CELLS_PER_INT) - 1
-            x, y = self._cellIndexToPosition(i)
-            if self[x][y]:
-                currentInt += 2 ** bit
-            if (i + 1) % self.CELLS_PER_INT == 0:
-                bits.append(currentInt)
-                currentInt = 0
-        bits.append(currentInt)
+        chunkMask = (1 << self.CELLS_PER_INT) - 1
+        for i in range(self.width * self.height / self.CELLS_PER_INT + 1):
+            chunk = (self.bits >> (i * self.CELLS_PER_INT)) & chunkMask
+            bits.append(int(bin(chunk)[2:].zfill(self.CELLS_PER_INT)[::-1], 2))
         return tuple(bits)
 
-    def _cellIndexToPosition(self, index):
-        x = index / self.height
-        y = index % self.height
-        return x, y
+    def toBytes(self):
+        "Returns the grid in the binary grid format (see gridBytes)"
+        return gridBytes(self.width, self.height, self.bits)
+
+    def fromBytes(data):
+        """
+        Reads a BitGrid written by Grid.toBytes or BitGrid.toBytes
+        """
+        width, height, bits, end = readGridBytes(data)
+        g = BitGrid(width, height)
+        g.bits = bits
+        return g
+    fromBytes = staticmethod(fromBytes)
 
     def _unpackBits(self, bits):
         """
         Fills in data from a bit-level representation
         """
-        cell = 0
-        for packed in bits:
-            for bit in self._unpackInt(packed, self.CELLS_PER_INT):
-                if cell == self.width * self.height: break
-                x, y = self._cellIndexToPosition(cell)
-                self[x][y] = bit
-                cell += 1
-
-    def _unpackInt(self, packed, size):
-        bools = []
-        if packed < 0: raise ValueError, "must be a positive integer"
-        for i in range(size):
-            n = 2 ** (self.CELLS_PER_INT - i - 1)
-            if packed >= n:
-                bools.append(True)
-                packed -= n
-            else:
-                bools.append(False)
-        return bools
+        numCells = self.width * self.height
+        for i, packed in enumerate(bits):
+            if packed < 0: raise ValueError, "must be a positive integer"
+            chunk = int(bin(packed)[2:].zfill(self.CELLS_PER_INT)[::-1], 2)
+            self.bits |= chunk << (i * self.CELLS_PER_INT)
+        self.bits &= (1 << numCells) - 1
+
+class BitGridColumn:
+    """
+    The column grid[x] of a BitGrid, so that grid[x][y] reads and writes
+    bit x * height + y of the parent grid.
+    """
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.offset = x * grid.height
+
+    def __len__(self):
+        return self.grid.height
+
+    def _bit(self, y):
+        if y < 0: y += self.grid.height
+        if y < 0 or y >= self.grid.height: raise IndexError('BitGrid index out of range')
+        return 1 << (self.offset + y)
+
+    def __getitem__(self, y):
+        return self.grid.bits & self._bit(y) != 0
+
+    def __setitem__(self, y, item):
+        if item:
+            self.grid.bits |= self._bit(y)
+        else:
+            self.grid.bits &= ~self._bit(y)
+
+    def count(self, item = True):
+        return [self[y] for y in range(self.grid.height)].count(item)
+
+_BYTES_TO_DIGITS = string.maketrans('\x00\x01', '01')
+_DIGITS_TO_BYTES = string.maketrans('01', '\x00\x01')
+
+def gridBytes(width, height, bits):
+    """
+    The binary grid format: width and height as two big-endian 16-bit
+    ints, then the cells as one big-endian unsigned int of
+    ceil(width * height / 8) bytes, in which cell (x,y) is bit
+    x * height + y (as in BitGrid.bits).
+    """
+    numBytes = (width * height + 7) / 8
+    if numBytes == 0: return struct.pack('>HH', width, height)
+    return struct.pack('>HH', width, height) + binascii.unhexlify('%0*x' % (2 * numBytes, bits))
+
+def readGridBytes(data, offset=0):
+    """
+    Reads a grid in the binary format at offset in data; returns its
+    width, height and bits and the offset just past it.
+    """
+    width, height = struct.unpack_from('>HH', data, offset)
+    start = offset + 4
+    end = start + (width * height + 7) / 8
+    bits = 0
+    if end > start: bits = int(binascii.hexlify(data[start:end]), 16)
+    return width, height, bits, end
 
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
@@ -368,21 +580,204 @@ class Actions:
         return (x + dx, y + dy)
     getSuccessor = staticmethod(getSuccessor)
 
-class GameStateData:
+ZOBRIST_KEYS_CACHE = {}
+
+class ZobristKeys:
     """
+    Random 64-bit keys for Zobrist hashing game states on a board of a given
+    size.  A state's hash is the XOR of the keys of its agent positions,
+    directions and scared timers, its food and its capsules.
 
+    Agent positions are keyed on a half-cell grid because scared ghosts move
+    at half speed.  Keys come from a private, fixed-seed generator so hashes
+    agree between processes and the global random state is left untouched.
     """
+    SEED = 188
+    MASK = (1 << 64) - 1
+    DIRECTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+
+    def __init__(self, width, height, numAgents):
+        rng = random.Random(ZobristKeys.SEED)
+        keys = lambda n: [rng.getrandbits(64) for i in range(n)]
+        self.width = width
+        self.height = height
+        self.positionKeys = [keys(4 * width * height) for i in range(numAgents)]
+        self.directionKeys = [dict(zip(ZobristKeys.DIRECTIONS, keys(5))) for i in range(numAgents)]
+        self.scaredKeys = [key | 1 for key in keys(numAgents)]
+        self.foodKeys = keys(width * height)
+        self.capsuleKeys = keys(width * height)
+
+    def forLayout(layout):
+        """
+        Returns the (cached) keys for a layout's board size and agent count.
+        """
+        size = (layout.width, layout.height, len(layout.agentPositions))
+        if size not in ZOBRIST_KEYS_CACHE:
+            ZOBRIST_KEYS_CACHE[size] = ZobristKeys(*size)
+        return ZOBRIST_KEYS_CACHE[size]
+    forLayout = staticmethod(forLayout)
+
+    def agentKey(self, agentIndex, agentState):
+        conf = agentState.configuration
+        if conf == None: return 0
+        x, y = conf.pos
+        cell = int(2 * x + 0.5) * 2 * self.height + int(2 * y + 0.5)
+        key = self.positionKeys[agentIndex][cell] ^ self.directionKeys[agentIndex][conf.direction]
+        return key ^ ((agentState.scaredTimer * self.scaredKeys[agentIndex]) & ZobristKeys.MASK)
+
+    def foodKey(self, position):
+        x, y = position
+        return self.foodKeys[x * self.height + y]
+
+    def capsuleKey(self, position):
+        x, y = position
+        return self.capsuleKeys[x * self.height + y]
+
+    def hashData(self, data):
+        """
+        Computes the Zobrist hash of a GameStateData from scratch.
+        """
+        h = 0
+        for index, agentState in enumerate(data.agentStates):
+            h ^= self.agentKey(index, agentState)
+        for position in data.food.asList():
+            h ^= self.foodKey(position)
+        for position in data.capsules:
+            h ^= self.capsuleKey(position)
+        return h
+
+class FoodFeatures(object):
+    """
+    The food list and nearest-food distances of one food grid,
+    shared by every state with that grid.  When Pacman eats, the new grid's
+    features are derived from the old ones (see eat) instead of rescanning
+    the board:
+
+      the food list is the old list less the pellet eaten, once asked for
+      a cached nearest food is still nearest if it has not been eaten, so
+        getNearestFood looks for one among its ancestors before scanning
+
+    Distances are Manhattan, or maze distances from the layout's table.
+    Each grid keeps at most MAX_ANCESTORS ancestors alive: the chain is cut
+    there, so a long game does not pin one grid per pellet eaten.
+    """
+    __slots__ = ('food', 'layout', 'parent', 'depth', 'eaten', '_foodList', '_nearest')
+    MAX_ANCESTORS = 32 # how many ancestors are kept, and searched by getNearestFood
+
+    def __init__(self, food, layout, parent=None, eaten=None):
+        self.food = food
+        self.layout = layout
+        if parent != None and parent.depth >= FoodFeatures.MAX_ANCESTORS:
+            parent = None
+        self.parent = parent
+        self.depth = 0 if parent == None else parent.depth + 1 # ancestors in the chain
+        self.eaten = eaten
+        self._foodList = None
+        self._nearest = {} # (position, maze) -> (distance, food position)
+
+    def eat(self, position, food):
+        "The features of food, which is this grid less the pellet at position"
+        return FoodFeatures(food, self.layout, self, position)
+
+    def getFoodList(self):
+        """
+        The positions of the food, in Grid.asList order.  Shared, so callers
+        must not modify it.
+        """
+        if self._foodList == None:
+            parent = self.parent
+            if parent != None and parent._foodList != None:
+                self._foodList = [food for food in parent._foodList if food != self.eaten]
+            else:
+                self._foodList = self.food.asList()
+        return self._foodList
+
+    def getNearestFood(self, position, maze=False):
+        """
+        Returns (distance, food position) for the food nearest position, or
+        None if there is none (or, for maze distances, none reachable).
+        """
+        key = (position, maze)
+        nearest = self._nearest.get(key)
+        if nearest != None: return nearest
+
+        features, food = self.parent, self.food
+        while features != None:
+            nearest = features._nearest.get(key)
+            if nearest != None:
+                x, y = nearest[1]
+                if food.get(x, y):
+                    self._nearest[key] = nearest
+                    return nearest
+                break
+            features = features.parent
+
+        nearest = None
+        for target in self.getFoodList():
+            if maze:
+                distance = self.layout.getMazeDistance(position, target)
+                if distance == None: continue
+            else:
+                distance = abs(position[0] - target[0]) + abs(position[1] - target[1])
+            if nearest == None or distance < nearest[0]:
+                nearest = (distance, target)
+        if nearest != None: self._nearest[key] = nearest
+        return nearest
+
+    def getNearestFoodDistance(self, position, maze=False):
+        nearest = self.getNearestFood(position, maze)
+        if nearest == None: return None
+        return nearest[0]
+
+    def __getstate__(self):
+        # the caches and the chain of ancestors are not worth shipping
+        return (self.food, self.layout)
+
+    def __setstate__(self, state):
+        self.food, self.layout = state
+        self.parent = self.eaten = self._foodList = None
+        self.depth = 0
+        self._nearest = {}
+
+class GameStateData(object):
+    """
+
+    """
+    # Millions of these are created in a search, so they have no __dict__
+    __slots__ = ('food', 'capsules', 'agentStates', '_sharedAgentStates', 'layout', '_eaten',
+                 'score', 'scoreChange', '_zobrist', '_foodEaten', '_foodAdded', '_capsuleEaten',
+                 '_agentMoved', '_lose', '_win', '_ply', '_foodFeatures', '_numFood')
+    __setstate__ = setSlotState # for states pickled before toBytes
+
+    # the binary format (see toBytes)
+    FORMAT_VERSION = 1
+    HEADER = struct.Struct('>BBHddi??QHhhhhb')
+    CAPSULE = struct.Struct('>HH')
+    AGENT = struct.Struct('>???dd?Bdd?Biii')
+
+    def __reduce__( self ):
+        # pickles (and so process pools) ship the binary format and the
+        # layout's text; the receiving process shares one Layout per text
+        return (_stateDataFromBytes, (self.toBytes(), self.layout.layoutText))
     def __init__( self, prevState = None ):
         """
-        Generates a new data packet by copying information from its predecessor.
+        Generates a new data packet from its predecessor.  The food, capsules
+        and agent states are shared with the predecessor until they are
+        written: the rules call writableAgentState before editing an agent,
+        and replace (rather than edit) the food grid and capsule list.
         """
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            self.food = prevState.food
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates[:]
+            self._sharedAgentStates = prevState.agentStates
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self._zobrist = prevState._zobrist
+            self._ply = prevState._ply
+            self._foodFeatures = prevState._foodFeatures
+            self._numFood = prevState._numFood
 
         self._foodEaten = None
         self._foodAdded = None
@@ -395,11 +790,15 @@ class GameStateData:
     def deepCopy( self ):
         state = GameStateData( self )
         state.food = self.food.deepCopy()
+        state.capsules = self.capsules[:]
+        state.agentStates = self.copyAgentStates( self.agentStates )
+        state._eaten = self._eaten[:]
         state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
         state._capsuleEaten = self._capsuleEaten
+        state._foodFeatures = FoodFeatures( state.food, state.layout )
         return state
 
     def copyAgentStates( self, agentStates ):
@@ -408,6 +807,107 @@ class GameStateData:
             copiedStates.append( agentState.copy() )
         return copiedStates
 
+    def toBytes( self ):
+        """
+        Packs everything but the layout into a string: a header (format
+        version, agents, capsules, score, score change, moves, win, lose,
+        Zobrist hash, food left and what the last move ate or moved), the
+        food in the binary grid format, the capsules, then each agent's
+        current and start configurations, timers and whether it was eaten.
+        """
+        foodEaten = self._foodEaten or (-1, -1)
+        capsuleEaten = self._capsuleEaten or (-1, -1)
+        agentMoved = self._agentMoved
+        if agentMoved == None: agentMoved = -1
+        parts = [GameStateData.HEADER.pack( GameStateData.FORMAT_VERSION, len( self.agentStates ),
+                                            len( self.capsules ), self.score, self.scoreChange, self._ply,
+                                            self._win, self._lose, self._zobrist, self._numFood,
+                                            foodEaten[0], foodEaten[1], capsuleEaten[0], capsuleEaten[1],
+                                            agentMoved ),
+                 self.food.toBytes()]
+        for x, y in self.capsules:
+            parts.append( GameStateData.CAPSULE.pack( x, y ) )
+        for agentState, eaten in zip( self.agentStates, self._eaten ):
+            conf, start = agentState.configuration, agentState.start
+            if conf == None: conf = Configuration( (0, 0), Directions.STOP )
+            parts.append( GameStateData.AGENT.pack( agentState.isPacman, eaten, agentState.configuration != None,
+                                                    conf.pos[0], conf.pos[1], type( conf.pos[0] ) is int,
+                                                    Directions.CODE[conf.direction],
+                                                    start.pos[0], start.pos[1], type( start.pos[0] ) is int,
+                                                    Directions.CODE[start.direction], agentState.scaredTimer,
+                                                    agentState.numCarrying, agentState.numReturned ) )
+        return ''.join( parts )
+
+    def fromBytes( data, layout ):
+        """
+        Unpacks a GameStateData written by toBytes, for the given layout.
+        Integer positions come back as ints and the others as floats.
+        """
+        header = GameStateData.HEADER.unpack_from( data )
+        if header[0] != GameStateData.FORMAT_VERSION:
+            raise Exception( 'Unknown state format version %d' % header[0] )
+        (version, numAgents, numCapsules, score, scoreChange, ply, win, lose, zobrist, numFood,
+         foodX, foodY, capsuleX, capsuleY, agentMoved) = header
+        state = GameStateData()
+        state.layout = layout
+        # scores travel as doubles, but are usually ints
+        if score == int( score ): score = int( score )
+        if scoreChange == int( scoreChange ): scoreChange = int( scoreChange )
+        state.score, state.scoreChange, state._ply = score, scoreChange, ply
+        state._win, state._lose, state._zobrist, state._numFood = win, lose, zobrist, numFood
+        if foodX >= 0: state._foodEaten = (foodX, foodY)
+        if capsuleX >= 0: state._capsuleEaten = (capsuleX, capsuleY)
+        if agentMoved >= 0: state._agentMoved = agentMoved
+
+        width, height, bits, offset = readGridBytes( data, GameStateData.HEADER.size )
+        state.food = BitGrid( width, height )
+        state.food.bits = bits
+        state._foodFeatures = FoodFeatures( state.food, layout )
+        state.capsules = []
+        for i in range( numCapsules ):
+            state.capsules.append( GameStateData.CAPSULE.unpack_from( data, offset ) )
+            offset += GameStateData.CAPSULE.size
+
+        def position( x, y, isInt ):
+            if isInt: return (int( x ), int( y ))
+            return (x, y)
+        state.agentStates = []
+        state._eaten = []
+        for i in range( numAgents ):
+            (isPacman, eaten, hasConf, x, y, isInt, direction, startX, startY, startIsInt, startDirection,
+             scaredTimer, numCarrying, numReturned) = GameStateData.AGENT.unpack_from( data, offset )
+            offset += GameStateData.AGENT.size
+            start = Configuration( position( startX, startY, startIsInt ), Directions.CODES[startDirection] )
+            agentState = AgentState( start, isPacman )
+            agentState.configuration = None
+            if hasConf:
+                agentState.configuration = Configuration( position( x, y, isInt ), Directions.CODES[direction] )
+            agentState.scaredTimer = scaredTimer
+            agentState.numCarrying = numCarrying
+            agentState.numReturned = numReturned
+            state.agentStates.append( agentState )
+            state._eaten.append( eaten )
+        state._sharedAgentStates = [None for a in state.agentStates]
+        return state
+    fromBytes = staticmethod( fromBytes )
+
+    def getFoodFeatures( self ):
+        "The FoodFeatures of the food grid, created the first time they are needed"
+        if self._foodFeatures == None or self._foodFeatures.food is not self.food:
+            self._foodFeatures = FoodFeatures( self.food, self.layout )
+        return self._foodFeatures
+
+    def writableAgentState( self, index ):
+        """
+        Returns agentStates[index] for editing, first replacing it with a
+        private copy if it is still shared with the predecessor.
+        """
+        agentState = self.agentStates[index]
+        if agentState is self._sharedAgentStates[index]:
+            agentState = agentState.copy()
+            self.agentStates[index] = agentState
+        return agentState
+
     def __eq__( self, other ):
         """
         Allows two states to be compared.
@@ -422,15 +922,31 @@ class GameStateData:
 
     def __hash__( self ):
         """
-        Allows states to be keys of dictionaries.
+        Allows states to be keys of dictionaries.  This is the 64-bit Zobrist
+        hash, which equal states share because it does not depend on the
+        path taken to reach them.
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError, e:
-                print e
-                #hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+        return self._zobrist
+
+    def updateHash( self, prevState ):
+        """
+        Updates the Zobrist hash copied from prevState by XORing out the old
+        and in the new keys of every agent that moved or whose scared timer
+        changed, and XORing out any food or capsule eaten since.
+        """
+        keys = ZobristKeys.forLayout( self.layout )
+        h = self._zobrist
+        for index, agentState in enumerate( self.agentStates ):
+            prevAgentState = prevState.agentStates[index]
+            if agentState is prevAgentState: continue
+            if agentState.configuration is not prevAgentState.configuration or \
+               agentState.scaredTimer != prevAgentState.scaredTimer:
+                h ^= keys.agentKey( index, prevAgentState ) ^ keys.agentKey( index, agentState )
+        if self._foodEaten != None:
+            h ^= keys.foodKey( self._foodEaten )
+        if self._capsuleEaten != None:
+            h ^= keys.capsuleKey( self._capsuleEaten )
+        self._zobrist = h
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
@@ -488,12 +1004,15 @@ class GameStateData:
         """
         Creates an initial game state from a layout array (see layout.py).
         """
-        self.food = layout.food.copy()
+        self.food = BitGrid.fromGrid(layout.food)
         #self.capsules = []
         self.capsules = layout.capsules[:]
         self.layout = layout
         self.score = 0
         self.scoreChange = 0
+        self._ply = 0 # moves made since the start of the game
+        self._foodFeatures = FoodFeatures( self.food, layout )
+        self._numFood = layout.totalFood # kept up to date by PacmanRules.consume
 
         self.agentStates = []
         numGhosts = 0
@@ -503,6 +1022,12 @@ class GameStateData:
                 else: numGhosts += 1
             self.agentStates.append( AgentState( Configuration( pos, Directions.STOP), isPacman) )
         self._eaten = [False for a in self.agentStates]
+        self._sharedAgentStates = [None for a in self.agentStates]
+        self._zobrist = ZobristKeys.forLayout( layout ).hashData( self )
+
+def _stateDataFromBytes( data, layoutText ):
+    import layout
+    return GameStateData.fromBytes( data, layout.getSharedLayout( layoutText ) )
 
 try:
     import boinc
@@ -528,6 +1053,7 @@ class Game:
         self.totalAgentTimes = [0 for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
         self.agentTimeout = False
+        self.profile = None # the search profile report, if the game was profiled
         import cStringIO
         self.agentOutput = [cStringIO.StringIO() for agent in agents]
 
@@ -727,3 +1253,36 @@ class Game:
                     self.unmute()
                     return
         self.display.finish()
+
+    def runFast( self ):
+        """
+        A lean control loop for trusted agents and no display: it plays the
+        same moves as run, but looks up each agent's methods once, passes
+        the state itself to observationFunction and getAction instead of a
+        copy, and neither times the agents nor catches their exceptions.
+        """
+        self.numMoves = 0
+        for agent in self.agents:
+            if hasattr(agent, 'registerInitialState'):
+                agent.registerInitialState(self.state.deepCopy())
+
+        observers = [getattr(agent, 'observationFunction', None) for agent in self.agents]
+        actors = [agent.getAction for agent in self.agents]
+        moveHistory = self.moveHistory
+        rules = self.rules
+        agentIndex = self.startingIndex
+        numAgents = len( self.agents )
+
+        while not self.gameOver:
+            observation = self.state
+            if observers[agentIndex] is not None:
+                observation = observers[agentIndex](observation)
+            action = actors[agentIndex](observation)
+            moveHistory.append( (agentIndex, action) )
+            self.state = self.state.generateSuccessor( agentIndex, action )
+            rules.process(self.state, self)
+            agentIndex = ( agentIndex + 1 ) % numAgents
+
+        for agent in self.agents:
+            if hasattr(agent, 'final'):
+                agent.final( self.state )
@@ -0,0 +1,242 @@
+# gameRecords.py
+# --------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+A compact binary format for archives of recorded games.
+
+A file is the magic string 'PACREC', a format version byte, then any
+number of records, each a type byte, a 32-bit body length and the body
+(all integers big-endian):
+
+  'L' layout  the layout's 8-byte hash (the start of the SHA-1 of its
+              text) and its text, written before the first game on it
+              (each writer writes its own, so one may appear many times)
+  'G' game    the layout's hash, the random seed (-1 if unknown), the
+              final score, whether Pacman won, the number of agents,
+              whether their class names follow, the index of the agent
+              that moved first, the number of moves, the names (each a
+              length byte and the name) and the moves as 3-bit direction
+              codes (game.Directions.CODES), the agents taking turns in
+              order
+
+Readers skip records of types they do not know.  Files are only ever
+appended to, so a writer can add games to an existing archive, and a
+reader can stream an archive of any size.
+
+> python gameRecords.py convert <old pickled games...> <archive>
+> python gameRecords.py list <archive>
+"""
+
+from game import Directions
+import layout
+import binascii, hashlib, os, struct, sys
+
+MAGIC = 'PACREC'
+VERSION = 1
+RECORD = struct.Struct('>cI')
+GAME = struct.Struct('>8sqd?B?BI')
+
+def getLayoutHash( layoutText ):
+    return hashlib.sha1( '\n'.join( layoutText ) ).digest()[:8]
+
+def packMoves( actions ):
+    "The actions' direction codes, 3 bits each, first action first"
+    bits = ''.join( [CODE_BITS[Directions.CODE[action]] for action in actions] )
+    bits += '0' * (-len( bits ) % 8)
+    if not bits: return ''
+    return binascii.unhexlify( '%0*x' % (len( bits ) / 4, int( bits, 2 )) )
+
+def unpackMoves( data, numMoves ):
+    if numMoves == 0: return []
+    bits = bin( int( binascii.hexlify( data ), 16 ) )[2:].zfill( 8 * len( data ) )
+    return [Directions.CODES[int( bits[i:i + 3], 2 )] for i in range( 0, 3 * numMoves, 3 )]
+
+CODE_BITS = [bin( code )[2:].zfill( 3 ) for code in range( len( Directions.CODES ) )]
+
+class RecordedGame:
+    """
+    One game read from an archive.  actions is the game's move history: a
+    list of (agentIndex, action) pairs, as Game.moveHistory.  agentNames
+    is empty if the agents are unknown.
+    """
+    def __init__( self, layout, seed, score, isWin, numAgents, agentNames, actions ):
+        self.layout = layout
+        self.seed = seed
+        self.score = score
+        self.isWin = isWin
+        self.numAgents = numAgents
+        self.agentNames = agentNames
+        self.actions = actions
+
+class GameRecordWriter:
+    """
+    Appends games to an archive, creating it if need be.  Every record is
+    flushed as it is written.  Opening an archive only checks its header:
+    the writer repeats the layouts it uses rather than scanning for them.
+    """
+    def __init__( self, path ):
+        self.path = path
+        self.layoutHashes = set() # layouts written by this writer
+        if os.path.exists( path ) and os.path.getsize( path ) > 0:
+            GameRecordReader( path ).close() # checks the magic and version
+            self.file = open( path, 'ab' )
+        else:
+            self.file = open( path, 'wb' )
+            self.file.write( MAGIC + chr( VERSION ) )
+
+    def writeRecord( self, recordType, body ):
+        self.file.write( RECORD.pack( recordType, len( body ) ) + body )
+
+    def write( self, layout, moveHistory, numAgents, seed=None, score=0, isWin=False, agentNames=() ):
+        """
+        Appends a game: its layout, its move history, the number of agents
+        and whatever else is known about it (agentNames, if given, must
+        name every agent).  The agents must have taken turns in order.
+        """
+        layoutHash = getLayoutHash( layout.layoutText )
+        if layoutHash not in self.layoutHashes:
+            self.writeRecord( 'L', layoutHash + '\n'.join( layout.layoutText ) )
+            self.layoutHashes.add( layoutHash )
+
+        if agentNames and len( agentNames ) != numAgents:
+            raise Exception( 'Expected %d agent names' % numAgents )
+        first = 0
+        if moveHistory: first = moveHistory[0][0]
+        for i, (agentIndex, action) in enumerate( moveHistory ):
+            if agentIndex != (first + i) % numAgents:
+                raise Exception( 'Move %d is by agent %d, out of turn' % (i, agentIndex) )
+        if seed == None: seed = -1
+
+        body = [GAME.pack( layoutHash, seed, score, isWin, numAgents, bool( agentNames ), first, len( moveHistory ) )]
+        for name in agentNames:
+            body.append( chr( len( name ) ) + name )
+        body.append( packMoves( [action for agentIndex, action in moveHistory] ) )
+        self.writeRecord( 'G', ''.join( body ) )
+        self.file.flush()
+
+    def close( self ):
+        self.file.close()
+
+class GameRecordReader:
+    """
+    Streams the games of an archive: iterating over a reader yields a
+    RecordedGame for each game in the file, in order.
+    """
+    def __init__( self, path ):
+        self.file = open( path, 'rb' )
+        header = self.file.read( len( MAGIC ) + 1 )
+        if len( header ) < len( MAGIC ) + 1 or header[:len( MAGIC )] != MAGIC:
+            self.file.close()
+            raise Exception( '%s is not a game record archive' % path )
+        if ord( header[-1] ) != VERSION:
+            self.file.close()
+            raise Exception( 'Unknown game record version %d in %s' % (ord( header[-1] ), path) )
+        self.layouts = {}
+
+    def readRecords( self ):
+        "Yields the (type, body) of every record"
+        while True:
+            header = self.file.read( RECORD.size )
+            if len( header ) < RECORD.size: return
+            recordType, length = RECORD.unpack( header )
+            body = self.file.read( length )
+            if len( body ) < length: raise Exception( 'Truncated game record' )
+            yield recordType, body
+
+    def __iter__( self ):
+        for recordType, body in self.readRecords():
+            if recordType == 'L':
+                self.layouts[body[:8]] = body[8:].split( '\n' )
+            elif recordType == 'G':
+                yield self.readGame( body )
+
+    def readGame( self, body ):
+        layoutHash, seed, score, isWin, numAgents, hasNames, first, numMoves = GAME.unpack_from( body )
+        offset = GAME.size
+        names = []
+        for i in range( numAgents * hasNames ):
+            length = ord( body[offset] )
+            names.append( body[offset + 1:offset + 1 + length] )
+            offset += 1 + length
+        if layoutHash not in self.layouts:
+            raise Exception( 'Game on a layout not in the archive' )
+        gameLayout = layout.getSharedLayout( self.layouts[layoutHash] )
+        moves = unpackMoves( body[offset:], numMoves )
+        actions = [((first + i) % numAgents, action) for i, action in enumerate( moves )]
+        if seed == -1: seed = None
+        return RecordedGame( gameLayout, seed, score, isWin, numAgents, names, actions )
+
+    def close( self ):
+        self.file.close()
+
+def isArchive( path ):
+    f = open( path, 'rb' )
+    try: return f.read( len( MAGIC ) ) == MAGIC
+    finally: f.close()
+
+def playMoves( gameLayout, actions, numAgents ):
+    "The final state of a game with the given moves"
+    import pacman
+    state = pacman.GameState()
+    state.initialize( gameLayout, numAgents - 1 )
+    for agentIndex, action in actions:
+        state = state.generateSuccessor( agentIndex, action )
+    return state
+
+def loadPickle( path ):
+    """
+    Reads a game recorded in the old pickle format ({'layout': ...,
+    'actions': ...}) as a RecordedGame.  Those recordings hold only the
+    layout and the moves, so the game is replayed for its score and
+    outcome; its seed and agents stay unknown.
+    """
+    import cPickle
+    f = open( path, 'rb' )
+    try: recorded = cPickle.load( f )
+    finally: f.close()
+    gameLayout, actions = recorded['layout'], recorded['actions']
+    numAgents = gameLayout.getNumGhosts() + 1
+    if actions:
+        numAgents = max( [agentIndex for agentIndex, action in actions] ) + 1
+    state = playMoves( gameLayout, actions, numAgents )
+    return RecordedGame( gameLayout, None, state.getScore(), state.isWin(), numAgents, [], actions )
+
+def convertPickle( path, writer ):
+    "Appends a game recorded in the old pickle format to a writer"
+    game = loadPickle( path )
+    writer.write( game.layout, game.actions, game.numAgents, score=game.score, isWin=game.isWin )
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if len( args ) >= 3 and args[0] == 'convert':
+        # read every game first, so a bad file leaves the archive untouched
+        games = [loadPickle( path ) for path in args[1:-1]]
+        writer = GameRecordWriter( args[-1] )
+        try:
+            for game in games:
+                writer.write( game.layout, game.actions, game.numAgents, score=game.score, isWin=game.isWin )
+        finally:
+            writer.close()
+        print 'Converted %d game(s) into %s' % (len( args ) - 2, args[-1])
+    elif len( args ) == 2 and args[0] == 'list':
+        reader = GameRecordReader( args[1] )
+        try:
+            for i, game in enumerate( reader ):
+                names = ', '.join( game.agentNames ) or 'unknown agents'
+                print '%d: %s, %d moves, score %s%s, seed %s' % (i, names, len( game.actions ),
+                    game.score, ['', ' (win)'][game.isWin], game.seed)
+        finally:
+            reader.close()
+    else:
+        print __doc__
@@ -0,0 +1,189 @@
+# gameReplay.py
+# -------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Random access to the states of a recorded game.
+
+A GameReplay regenerates states from the recorded moves, without a
+display, and keeps a keyframe (the state in GameState.toBytes form) every
+keyframeInterval moves as it goes.  getState(n) then starts from the
+nearest keyframe, or from the last state it returned if that is closer,
+so seeking anywhere in a game costs at most keyframeInterval moves once
+the game has been played through.
+
+> python gameReplay.py state <archive> <game> <move>
+                prints the board after that many moves of that game
+> python gameReplay.py rescore <archive> <evaluation function> [agent]
+                evaluates every state an agent (Pacman by default) was
+                given in every game of the archive, with an evaluation
+                function from multiAgents.py, and prints each game's
+                lowest value and where it came
+> python gameReplay.py check <archive>
+                replays every game of the archive (as pacman.py --replay
+                does) from move 0 and from every keyframe and half-way
+                between, and reports any start that ends on a different
+                board than the game itself
+"""
+
+import sys
+
+class GameReplay:
+    """
+    The states of a game: initialState followed by actions, a list of
+    (agentIndex, action) pairs as in Game.moveHistory.
+    """
+    def __init__( self, initialState, actions, keyframeInterval=50 ):
+        self.actions = actions
+        self.layout = initialState.data.layout
+        self.keyframeInterval = keyframeInterval
+        self.keyframes = [initialState.toBytes()]
+        self.stateClass = initialState.__class__
+        self.position = 0
+        self.state = initialState
+
+    def fromRecord( recordedGame, keyframeInterval=50 ):
+        "A GameReplay of a gameRecords.RecordedGame"
+        import pacman
+        state = pacman.GameState()
+        state.initialize( recordedGame.layout, recordedGame.numAgents - 1 )
+        return GameReplay( state, recordedGame.actions, keyframeInterval )
+    fromRecord = staticmethod( fromRecord )
+
+    def __len__( self ):
+        "The number of moves"
+        return len( self.actions )
+
+    def getState( self, n ):
+        """
+        The state after the first n moves (n from 0 to len(self)).
+        """
+        if n < 0 or n > len( self.actions ):
+            raise IndexError( 'The game has no move %d' % n )
+        keyframe = min( n / self.keyframeInterval, len( self.keyframes ) - 1 )
+        start = keyframe * self.keyframeInterval
+        if not start <= self.position <= n:
+            self.position = start
+            self.state = self.stateClass.fromBytes( self.keyframes[keyframe], self.layout )
+        while self.position < n:
+            self.state = self.state.generateSuccessor( *self.actions[self.position] )
+            self.position += 1
+            if self.position % self.keyframeInterval == 0 and \
+               self.position / self.keyframeInterval == len( self.keyframes ):
+                self.keyframes.append( self.state.toBytes() )
+        return self.state
+
+    def getStates( self, start=0, end=None ):
+        "Yields (n, the state after n moves) for n from start up to end"
+        if end == None: end = len( self.actions )
+        for n in range( start, end + 1 ):
+            yield n, self.getState( n )
+
+    def evaluate( self, evaluationFunction, agentIndex=0 ):
+        """
+        Returns (n, value) for every state after n moves that the agent was
+        given to move from, with value the evaluation function's value of it.
+        """
+        values = []
+        for n, state in self.getStates( 0, len( self.actions ) - 1 ):
+            if self.actions[n][0] == agentIndex:
+                values.append( (n, evaluationFunction( state )) )
+        return values
+
+def rescoreArchive( path, evaluationFunction, agentIndex=0 ):
+    """
+    Yields (game, GameReplay.evaluate's values) for each game of an archive
+    """
+    import gameRecords
+    reader = gameRecords.GameRecordReader( path )
+    try:
+        for game in reader:
+            yield game, GameReplay.fromRecord( game ).evaluate( evaluationFunction, agentIndex )
+    finally:
+        reader.close()
+
+class BoardDisplay:
+    """
+    A display that keeps the food and capsules a graphical display would
+    show: those of the state it is initialized with, less those each update
+    says were eaten.
+    """
+    def initialize( self, state, isBlue=False ):
+        self.food = set( state.food.asList() )
+        self.capsules = set( state.capsules )
+
+    def update( self, state ):
+        if state._foodEaten != None: self.food.discard( state._foodEaten )
+        if state._capsuleEaten != None: self.capsules.discard( state._capsuleEaten )
+
+    def finish( self ):
+        pass
+
+def checkReplay( recordedGame ):
+    """
+    Replays a game with pacman.replayGame from move 0, from every keyframe
+    (of its GameReplay's default interval) and from half-way between, and
+    returns the starts after which the board shown at the end is not the
+    final state's.
+    """
+    import pacman
+    final = GameReplay.fromRecord( recordedGame )
+    final = final.getState( len( final ) ).data
+    board = (set( final.food.asList() ), set( final.capsules ))
+    wrong = []
+    for start in range( 0, len( recordedGame.actions ) + 1, 25 ):
+        display = BoardDisplay()
+        pacman.replayGame( recordedGame.layout, recordedGame.actions, display, start,
+                           recordedGame.numAgents - 1, quiet=True )
+        if (display.food, display.capsules) != board: wrong.append( start )
+    return wrong
+
+def getRecordedGame( path, index ):
+    import gameRecords
+    reader = gameRecords.GameRecordReader( path )
+    try:
+        for i, game in enumerate( reader ):
+            if i == index: return game
+    finally:
+        reader.close()
+    raise Exception( 'The archive has no game %d' % index )
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if len( args ) == 4 and args[0] == 'state':
+        replay = GameReplay.fromRecord( getRecordedGame( args[1], int( args[2] ) ) )
+        print replay.getState( int( args[3] ) )
+    elif len( args ) in [3, 4] and args[0] == 'rescore':
+        import multiAgents, util
+        evaluationFunction = util.lookup( args[2], multiAgents.__dict__ )
+        agentIndex = 0
+        if len( args ) == 4: agentIndex = int( args[3] )
+        for i, (game, values) in enumerate( rescoreArchive( args[1], evaluationFunction, agentIndex ) ):
+            if not values:
+                print '%d: no moves by agent %d' % (i, agentIndex)
+                continue
+            lowest, move = min( [(value, n) for n, value in values] )
+            print '%d: %d moves, score %s, final value %s, lowest value %s after move %d' % \
+                (i, len( game.actions ), game.score, values[-1][1], lowest, move)
+    elif len( args ) == 2 and args[0] == 'check':
+        import gameRecords
+        reader = gameRecords.GameRecordReader( args[1] )
+        try:
+            for i, game in enumerate( reader ):
+                wrong = checkReplay( game )
+                if wrong: print '%d: wrong board when started at moves %s' % (i, wrong)
+                else: print '%d: %d moves, ok' % (i, len( game.actions ))
+        finally:
+            reader.close()
+    else:
+        print __doc__
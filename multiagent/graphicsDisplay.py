@@ -204,8 +204,9 @@ class PacmanGraphics:
     def drawStaticObjects(self, state):
         layout = self.layout
         self.drawWalls(layout.walls)
-        self.food = self.drawFood(layout.food)
-        self.capsules = self.drawCapsules(layout.capsules)
+        # the state's, not the layout's: a replay may start mid-game
+        self.food = self.drawFood(state.food)
+        self.capsules = self.drawCapsules(state.capsules)
         refresh()
 
     def drawAgentObjects(self, state):
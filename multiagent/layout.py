@@ -14,10 +14,18 @@
 
 from util import manhattanDistance
 from game import Grid
+from game import Actions
+from game import Configuration
+from game import Directions
 import os
 import random
+import array
 
 VISIBILITY_MATRIX_CACHE = {}
+ACTION_TABLE_CACHE = {}
+MAZE_DISTANCE_CACHE = {}
+SHARED_LAYOUTS = {}
+UNREACHABLE = 0xFFFF
 
 class Layout:
     """
@@ -35,6 +43,9 @@ class Layout:
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
         self.totalFood = len(self.food.asList())
+        self.actionTable = None
+        self.moveTable = None
+        self.mazeDistances = None
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
@@ -61,6 +72,165 @@ class Layout:
         else:
             self.visibility = VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)]
 
+    def initializeActionTable(self):
+        """
+        Precomputes the legal actions at every open cell, indexed by the
+        integer cell x * height + y: Pacman's actions, and for each current
+        direction the ghost actions (no stopping, and no reversing except at
+        a dead end).  Alongside them, the move table maps each of those
+        actions to the (position, cell) it leads to at full speed: integer
+        positions for Pacman, and float positions for ghosts as
+        GhostRules.GHOST_SPEED gives them.  Agents between grid points are
+        not covered.
+        """
+        global ACTION_TABLE_CACHE
+        key = reduce(str.__add__, self.layoutText)
+        if key not in ACTION_TABLE_CACHE:
+            directions = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+            pacmanActions = [None] * (self.width * self.height)
+            ghostActions = [None] * (self.width * self.height)
+            pacmanMoves = [None] * (self.width * self.height)
+            ghostMoves = [None] * (self.width * self.height)
+            for x in range(self.width):
+                for y in range(self.height):
+                    if self.walls[x][y]: continue
+                    try:
+                        possible = Actions.getPossibleActions(Configuration((x, y), Directions.STOP), self.walls)
+                    except IndexError:
+                        continue # open edge cells are left to the rules
+                    cell = x * self.height + y
+                    pacmanActions[cell] = tuple(possible)
+                    pacmanMoves[cell] = {}
+                    for action in possible:
+                        dx, dy = Actions.directionToVector(action, 1)
+                        pacmanMoves[cell][action] = ((x + dx, y + dy), (x + dx) * self.height + y + dy)
+                    ghostActions[cell] = {}
+                    ghostMoves[cell] = {}
+                    for direction in directions:
+                        legal = [a for a in possible if a != Directions.STOP]
+                        reverse = Actions.reverseDirection(direction)
+                        if reverse in legal and len(legal) > 1:
+                            legal.remove(reverse)
+                        ghostActions[cell][direction] = tuple(legal)
+                        ghostMoves[cell][direction] = {}
+                        for action in legal:
+                            dx, dy = Actions.directionToVector(action, 1)
+                            ghostMoves[cell][direction][action] = ((float(x + dx), float(y + dy)), (x + dx) * self.height + y + dy)
+            ACTION_TABLE_CACHE[key] = ((pacmanActions, ghostActions), (pacmanMoves, ghostMoves))
+        self.actionTable, self.moveTable = ACTION_TABLE_CACHE[key]
+
+    def getCell(self, pos):
+        """
+        Returns the integer cell id x * height + y of a grid point, or -1 if
+        pos is between grid points or off the board.
+        """
+        x, y = pos
+        ix, iy = int(x), int(y)
+        if x != ix or y != iy or ix < 0 or iy < 0 or ix >= self.width or iy >= self.height: return -1
+        return ix * self.height + iy
+
+    def getConfigurationCell(self, conf):
+        "Returns getCell of a Configuration's position, caching it on the Configuration"
+        cell = conf.cell
+        if cell == None:
+            cell = conf.cell = self.getCell(conf.pos)
+        return cell
+
+    def getLegalPacmanActions(self, cell):
+        """
+        Returns a fresh list of Pacman's legal actions at a cell, or None if
+        the cell is -1 (between grid points) or not in the table.
+        """
+        if cell < 0: return None
+        if self.actionTable == None: self.initializeActionTable()
+        actions = self.actionTable[0][cell]
+        if actions == None: return None
+        return list(actions)
+
+    def getLegalGhostActions(self, cell, direction):
+        """
+        Returns a fresh list of a ghost's legal actions at a cell given its
+        current direction, or None as for getLegalPacmanActions.
+        """
+        if cell < 0: return None
+        if self.actionTable == None: self.initializeActionTable()
+        actions = self.actionTable[1][cell]
+        if actions == None: return None
+        return list(actions[direction])
+
+    def getPacmanMoves(self, cell):
+        """
+        Returns the move table entry for Pacman at a cell, {action: (position,
+        cell)} over the legal actions, or None as for getLegalPacmanActions.
+        """
+        if cell < 0: return None
+        if self.moveTable == None: self.initializeActionTable()
+        return self.moveTable[0][cell]
+
+    def getGhostMoves(self, cell, direction):
+        """
+        Returns the move table entry for a ghost at a cell moving at full
+        speed given its current direction, or None.
+        """
+        if cell < 0: return None
+        if self.moveTable == None: self.initializeActionTable()
+        moves = self.moveTable[1][cell]
+        if moves == None: return None
+        return moves[direction]
+
+    def initializeMazeDistances(self):
+        """
+        Computes the shortest-path distance between every pair of open cells
+        with one breadth-first search per cell.  The open cells are numbered
+        0..n-1 (cellIds maps x * height + y to that number, or -1 for walls)
+        and the distances are kept in an n * n array of unsigned shorts.
+        """
+        global MAZE_DISTANCE_CACHE
+        key = reduce(str.__add__, self.layoutText)
+        if key not in MAZE_DISTANCE_CACHE:
+            cellIds = [-1] * (self.width * self.height)
+            cells = []
+            for x in range(self.width):
+                for y in range(self.height):
+                    if not self.walls[x][y]:
+                        cellIds[x * self.height + y] = len(cells)
+                        cells.append((x, y))
+            neighbors = [[cellIds[nx * self.height + ny] for nx, ny in Actions.getLegalNeighbors(cell, self.walls)]
+                         for cell in cells]
+            n = len(cells)
+            distances = array.array('H', [UNREACHABLE]) * (n * n)
+            for source in range(n):
+                row = source * n
+                distances[row + source] = 0
+                frontier = [source]
+                dist = 0
+                while frontier:
+                    dist += 1
+                    nextFrontier = []
+                    for cell in frontier:
+                        for neighbor in neighbors[cell]:
+                            if distances[row + neighbor] == UNREACHABLE:
+                                distances[row + neighbor] = dist
+                                nextFrontier.append(neighbor)
+                    frontier = nextFrontier
+            MAZE_DISTANCE_CACHE[key] = (cellIds, n, distances)
+        self.mazeDistances = MAZE_DISTANCE_CACHE[key]
+
+    def getMazeDistance(self, pos1, pos2):
+        """
+        Returns the number of steps on the shortest path between two
+        positions, or None if either is a wall or no path exists.  Positions
+        between grid points (scared ghosts) are rounded to the nearest one.
+        """
+        if self.mazeDistances == None: self.initializeMazeDistances()
+        cellIds, n, distances = self.mazeDistances
+        id1 = cellIds[int(pos1[0] + 0.5) * self.height + int(pos1[1] + 0.5)]
+        id2 = cellIds[int(pos2[0] + 0.5) * self.height + int(pos2[1] + 0.5)]
+        if id1 < 0 or id2 < 0: return None
+        dist = distances[id1 * n + id2]
+        if dist == UNREACHABLE: return None
+        return dist
+
     def isWall(self, pos):
         x, col = pos
         return self.walls[x][col]
@@ -89,8 +259,26 @@ class Layout:
     def __str__(self):
         return "\n".join(self.layoutText)
 
+    def __getstate__(self):
+        # the derived tables are rebuilt (or found in the caches) on demand
+        state = self.__dict__.copy()
+        state['actionTable'] = None
+        state['moveTable'] = None
+        state['mazeDistances'] = None
+        return state
+
+    def __setstate__(self, state):
+        # layouts pickled before the tables existed (old recorded games) lack them
+        self.__dict__.update(state)
+        for name in ['actionTable', 'moveTable', 'mazeDistances']:
+            if name not in self.__dict__: setattr(self, name, None)
+
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        layout = Layout(self.layoutText[:])
+        layout.actionTable = self.actionTable
+        layout.moveTable = self.moveTable
+        layout.mazeDistances = self.mazeDistances
+        return layout
 
     def processLayoutText(self, layoutText):
         """
@@ -142,6 +330,17 @@ def getLayout(name, back = 2):
         os.chdir(curdir)
     return layout
 
+def getSharedLayout(layoutText):
+    """
+    Returns this process's one Layout of the given text, building it the
+    first time.  States unpickled from other processes share it (and its
+    derived tables) rather than each carrying a copy.
+    """
+    key = tuple(layoutText)
+    if key not in SHARED_LAYOUTS:
+        SHARED_LAYOUTS[key] = Layout(list(layoutText))
+    return SHARED_LAYOUTS[key]
+
 def tryToLoad(fullname):
     if(not os.path.exists(fullname)): return None
     f = open(fullname)
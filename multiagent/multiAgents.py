@@ -10,12 +10,20 @@
 # (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
 # Student side autograding was added by Brad Miller, Nick Hay, and
 # Pieter Abbeel (pabbeel@cs.berkeley.edu).
+import math
 import sys
+import time
 
 from util import manhattanDistance
 from game import Directions
+from game import Actions
 import random, util
 
+try:
+    import fcntl # locks the search cache file while saving (POSIX only)
+except ImportError:
+    fcntl = None
+
 from game import Agent
 
 class ReflexAgent(Agent):
@@ -37,14 +45,12 @@ class ReflexAgent(Agent):
         newGhostStates = successorGameState.getGhostStates()
         newScaredTimes = [ghostState.scaredTimer for ghostState in newGhostStates]
         badGhosts = dict()
-        foodCoords = currentGameState.getFood().asList()
         min = sys.maxsize
 
-        # compute values for the successor
-        for food in foodCoords:
-            manDis = manhattanDistance(newPos, food)
-            if manDis < min:
-                min = manDis
+        # compute values for the successor: the distance to the nearest food
+        nearest = currentGameState.getFoodFeatures().getNearestFoodDistance(newPos)
+        if nearest is not None:
+            min = nearest
 
         if min is 0: min = 1
 
@@ -74,6 +80,272 @@ def scoreEvaluationFunction(currentGameState):
     """
     return currentGameState.getScore()
 
+class TranspositionTable:
+    """
+      A fixed-size table of searched positions, indexed by a Zobrist-style
+      key (see GameState.getZobristHash).  Each slot holds the remaining
+      search depth, the value, whether that value is exact or only a lower
+      or upper bound (alpha-beta cutoffs give bounds), and the best action.
+
+      A slot is overwritten by a different position or by a search of the
+      same position to at least the same depth.
+    """
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+    def __init__(self, size=65536):
+        self.size = size
+        self.clear()
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.probes = 0
+        self.hits = 0
+
+    def lookup(self, key, depth):
+        """
+          Returns (flag, value, action) for the key if it was searched to at
+          least depth remaining plies, otherwise None.
+        """
+        self.probes += 1
+        entry = self.entries[hash(key) % self.size]
+        if entry is None or entry[0] != key or entry[1] < depth:
+            return None
+        self.hits += 1
+        return entry[2:]
+
+    def getBestAction(self, key):
+        """
+          Returns the best action stored for the key at any depth, or None.
+        """
+        entry = self.entries[hash(key) % self.size]
+        if entry is None or entry[0] != key:
+            return None
+        return entry[4]
+
+    def store(self, key, depth, flag, value, action=None):
+        index = hash(key) % self.size
+        entry = self.entries[index]
+        if entry is None or entry[0] != key or entry[1] <= depth:
+            self.entries[index] = (key, depth, flag, value, action)
+
+    def hitRate(self):
+        if self.probes == 0: return 0.0
+        return float(self.hits) / self.probes
+
+    def __str__(self):
+        return "Transposition table: %d probes, %d hits (%.1f%%)" % (self.probes, self.hits, 100 * self.hitRate())
+
+class SearchCache:
+    """
+      A persistent cache of the actions chosen at root positions, shared by
+      every agent in the process that names the same file.  Keys are the
+      layout (the hash of its text, since the Zobrist keys depend only on
+      its size), the position (its Zobrist hash and score), the search
+      depth, the agent's search (see MultiAgentSearchAgent.getSearchName)
+      and the evaluation function's name.  At most size entries are kept,
+      evicting the least recently used.  The entries are loaded from the
+      file when the cache is created and written back (pickled) by save,
+      merged with whatever other processes have saved since.
+
+      A cached action is the one a fresh search would choose only if the
+      evaluation function is deterministic.
+    """
+    def __init__(self, path, size=100000):
+        import collections, cPickle, os
+        self.path = path
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.probes = 0
+        self.hits = 0
+        self.dirty = False
+        self.layout = None
+        self.layoutHash = None
+        if os.path.exists(path):
+            self.entries.update(self.load())
+            self.evict()
+
+    def load(self):
+        "The (key, action) pairs in the cache file, least recently used first"
+        import cPickle
+        f = open(self.path, 'rb')
+        try: return cPickle.load(f)
+        finally: f.close()
+
+    def getLayoutHash(self, layout):
+        "The layout's part of the keys, remembered for the last layout seen"
+        if layout is not self.layout:
+            import gameRecords
+            self.layout = layout
+            self.layoutHash = gameRecords.getLayoutHash(layout.layoutText)
+        return self.layoutHash
+
+    def lookup(self, key):
+        self.probes += 1
+        action = self.entries.pop(key, None)
+        if action is None: return None
+        self.entries[key] = action # most recently used
+        self.hits += 1
+        return action
+
+    def store(self, key, action):
+        self.entries.pop(key, None)
+        self.entries[key] = action
+        self.dirty = True
+        self.evict()
+
+    def evict(self):
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        """
+          Writes the entries, least recently used first, to a temporary file
+          that then replaces the cache file.  The file's current entries are
+          merged in first, as less recently used than this cache's, so that
+          processes sharing a file (runGames' workers) keep each other's
+          entries.  Saves are serialized by a lock on path + '.lock' where
+          fcntl is available.
+        """
+        import collections, cPickle, os
+        if not self.dirty: return
+        lock = open(self.path + '.lock', 'a')
+        try:
+            if fcntl is not None: fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(self.path):
+                entries = collections.OrderedDict(self.load())
+                for key, action in self.entries.iteritems():
+                    entries.pop(key, None)
+                    entries[key] = action
+                self.entries = entries
+                self.evict()
+            tmp = '%s.%d.tmp' % (self.path, os.getpid())
+            f = open(tmp, 'wb')
+            try: cPickle.dump(self.entries.items(), f, 2)
+            finally: f.close()
+            os.rename(tmp, self.path)
+        finally:
+            lock.close() # releases the lock
+        self.dirty = False
+
+    def __str__(self):
+        return "Search cache %s: %d entries, %d probes, %d hits" % (self.path, len(self.entries), self.probes, self.hits)
+
+# SearchCaches by file, so that agents naming the same file share one
+SEARCH_CACHES = {}
+
+class MoveOrdering:
+    """
+      Orders the actions tried at each alpha-beta node so that cutoffs come
+      early.  Actions are sorted by, in priority order, whichever of these
+      heuristics are enabled:
+
+        pv       the best action stored for this position in the
+                 transposition table (needs transposition=True)
+        killers  the last two actions that caused a cutoff at this depth
+        history  how often (weighted by depth squared) an action from this
+                 agent's position has caused a cutoff
+        static   for Pacman, eating food first and stopping last; for ghosts,
+                 the maze distance to Pacman after the move, shortest first
+                 (reversed when the agent moves on the other side's layer)
+    """
+    HEURISTICS = ['pv', 'killers', 'history', 'static']
+
+    def __init__(self, heuristics):
+        for name in heuristics:
+            if name not in MoveOrdering.HEURISTICS:
+                raise Exception('Unknown move ordering heuristic: ' + name)
+        self.heuristics = list(heuristics)
+        self.usePV = 'pv' in heuristics
+        self.useKillers = 'killers' in heuristics
+        self.useHistory = 'history' in heuristics
+        self.useStatic = 'static' in heuristics
+        self.killers = {}
+        self.history = util.Counter()
+
+    def newSearch(self):
+        """
+          Forgets the killers of the previous search and ages the history.
+        """
+        self.killers = {}
+        for key in self.history.keys():
+            self.history[key] /= 2
+
+    def getPosition(self, gameState, agentInd):
+        if agentInd == 0:
+            return gameState.getPacmanPosition()
+        return gameState.getGhostPosition(agentInd)
+
+    def staticScore(self, gameState, agentInd, position, action):
+        """
+          Higher is better for Pacman.
+        """
+        if agentInd == 0:
+            if action == Directions.STOP: return -1
+            x, y = Actions.getSuccessor(position, action)
+            return int(gameState.hasFood(int(x), int(y)))
+        nextPosition = Actions.getSuccessor(position, action)
+        distance = gameState.getMazeDistance(nextPosition, gameState.getPacmanPosition())
+        if distance == None: return sys.maxsize
+        return distance
+
+    def orderActions(self, gameState, agentInd, actions, depth, isMax, pvAction=None):
+        if len(actions) < 2: return actions
+        position = self.getPosition(gameState, agentInd)
+        killers = self.killers.get(depth, [])
+        sign = 1
+        if not isMax: sign = -1
+        def priority(action):
+            key = []
+            if self.usePV: key.append(action == pvAction)
+            if self.useKillers: key.append(action in killers)
+            if self.useHistory: key.append(self.history[(agentInd, position, action)])
+            if self.useStatic: key.append(sign * self.staticScore(gameState, agentInd, position, action))
+            return key
+        return sorted(actions, key=priority, reverse=True)
+
+    def recordCutoff(self, gameState, agentInd, action, depth):
+        if self.useKillers:
+            killers = self.killers.setdefault(depth, [])
+            if action not in killers:
+                killers.insert(0, action)
+                del killers[2:]
+        if self.useHistory:
+            self.history[(agentInd, self.getPosition(gameState, agentInd), action)] += depth * depth
+
+# Set in each worker process of a parallel search agent's pool (see
+# MultiAgentSearchAgent.getParallelAction).
+_workerAgent = None
+_sharedAlpha = None
+
+def _initSearchWorker(agent, sharedAlpha):
+    global _workerAgent, _sharedAlpha
+    _workerAgent = agent
+    _sharedAlpha = sharedAlpha
+
+def _searchTask(task):
+    rootIndex, replyIndex, gameState, agentInd, depth = task
+    value = _workerAgent.searchNode(gameState, agentInd, depth, _sharedAlpha.value)
+    return rootIndex, replyIndex, value
+
+def _treeSearchTask(task):
+    gameState, seed = task
+    return _workerAgent.getRootStatistics(gameState, seed)
+
+class SearchTimeout(Exception):
+    """
+      Raised inside an anytime search when the move's time budget runs out.
+    """
+    pass
+
+class EvalBoundsError(Exception):
+    """
+      Raised inside a pruned expectimax search by an evaluation outside the
+      agent's evalBounds.
+    """
+    pass
+
 class MultiAgentSearchAgent(Agent):
     """
       This class provides some common elements to all of your
@@ -89,10 +361,222 @@ class MultiAgentSearchAgent(Agent):
       is another abstract class.
     """
 
-    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2'):
+    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2',
+                 transposition = 'False', tableSize = '65536',
+                 anytime = 'False', maxDepth = '10', timeSafety = '0.5',
+                 workers = '0', splitReplies = 'False',
+                 searchCache = '', cacheSize = '100000'):
         self.index = 0 # Pacman is always agent index 0
         self.evaluationFunction = util.lookup(evalFn, globals())
+        self.evaluationName = self.evaluationFunction.__name__ # survives wrapping (see searchProfiler)
         self.depth = int(depth)
+        self.transpositionTable = None
+        if str(transposition) == 'True':
+            self.transpositionTable = TranspositionTable(int(tableSize))
+
+        # anytime search: deepen until the move's time budget is nearly spent
+        self.anytime = str(anytime) == 'True'
+        self.maxDepth = int(maxDepth)
+        self.timeSafety = float(timeSafety)
+        self.deadline = None
+        self.registerTimeLimits(30, 30) # ClassicGameRules' default timeout
+
+        # parallel search: split the root (and optionally the first ghost's
+        # replies) across a pool of worker processes
+        self.workers = int(workers)
+        self.splitReplies = str(splitReplies) == 'True'
+        self.pool = None
+
+        # persistent cache of root actions (see SearchCache), consulted
+        # before every search except anytime ones
+        self.searchCache = None
+        if searchCache:
+            if searchCache not in SEARCH_CACHES:
+                SEARCH_CACHES[searchCache] = SearchCache(searchCache, int(cacheSize))
+            self.searchCache = SEARCH_CACHES[searchCache]
+
+    def getSearchName(self):
+        """
+          Names the search this agent runs, for SearchCache keys: agents with
+          the same name, depth and evaluation function choose the same action.
+        """
+        return self.__class__.__name__
+
+    def getAction(self, gameState):
+        """
+          Returns the searchCache's action for gameState if it has one, and
+          otherwise the action searchAction chooses.
+        """
+        if self.searchCache is not None and not self.anytime:
+            return self.getCachedAction(gameState)
+        return self.searchAction(gameState)
+
+    def searchAction(self, gameState):
+        """
+          Searches for the action to play from gameState.
+        """
+        util.raiseNotDefined()
+
+    def getCachedAction(self, gameState):
+        key = (self.searchCache.getLayoutHash(gameState.data.layout), gameState.getZobristHash(),
+               gameState.getScore(), self.depth, self.getSearchName(), self.evaluationName)
+        action = self.searchCache.lookup(key)
+        if action is not None and action not in gameState.getLegalActions(0):
+            action = None
+        if action is None:
+            action = self.searchAction(gameState)
+            self.searchCache.store(key, action)
+        return action
+
+    def registerTimeLimits(self, moveTimeout, maxTotalTime):
+        """
+          Called by ClassicGameRules.newGame with the limits Game.run enforces
+          on this agent: seconds per move and seconds for the whole game.
+        """
+        self.moveTimeout = moveTimeout
+        self.maxTotalTime = maxTotalTime
+        self.totalTime = 0.0
+
+    def getMoveBudget(self, gameState):
+        """
+          Seconds to spend on this move: a share of the game's remaining time
+          (assuming two moves per remaining food pellet plus 50 for chasing
+          the last few), never more than the per-move timeout, scaled down
+          by timeSafety.
+        """
+        remainingTime = self.maxTotalTime - self.totalTime
+        remainingMoves = 50 + 2 * gameState.getNumFood()
+        return self.timeSafety * max(0, min(self.moveTimeout, remainingTime / remainingMoves))
+
+    def checkDeadline(self):
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout()
+
+    def getAnytimeAction(self, gameState):
+        """
+          Iterative deepening: searches to depth 1, 2, ... maxDepth and
+          returns the best action of the deepest search that finished inside
+          the move's time budget.  Each iteration tries the root actions in
+          the order of the previous iteration's values.  The depth-1 search
+          always runs to completion.
+        """
+        startTime = time.time()
+        budget = self.getMoveBudget(gameState)
+        actions = gameState.getLegalActions(0)
+        bestAction = actions[0]
+        self.deadline = None
+        try:
+            for depth in range(1, self.maxDepth + 1):
+                values = self.getRootValues(gameState, actions, depth)
+                bestValue = max(values)
+                bestAction = actions[values.index(bestValue)]
+                self.searchedDepth = depth
+
+                ranked = sorted(zip(values, range(len(actions))), key=lambda x: (-x[0], x[1]))
+                actions = [actions[i] for value, i in ranked]
+                self.deadline = startTime + budget
+                self.checkDeadline()
+        except SearchTimeout:
+            pass
+        self.deadline = None
+        self.totalTime += time.time() - startTime
+        return bestAction
+
+    def getRootValues(self, gameState, actions, depth):
+        """
+          Returns the value of each root action searched to the given depth.
+          Agents that support anytime search override this.
+        """
+        util.raiseNotDefined()
+
+    def getTableKey(self, gameState, agentInd):
+        """
+          Keys a position in the transposition table.  The score is part of
+          the key so any evaluation function can be cached safely.
+        """
+        return (gameState.getZobristHash(), gameState.getScore(), agentInd)
+
+    def final(self, gameState):
+        if self.transpositionTable is not None:
+            print self.transpositionTable
+            # the entries stay for the next game; the statistics are per game
+            self.transpositionTable.probes = self.transpositionTable.hits = 0
+        if self.searchCache is not None:
+            self.searchCache.save()
+            print self.searchCache
+            self.searchCache.probes = self.searchCache.hits = 0
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def searchNode(self, gameState, agentInd, depth, alpha):
+        """
+          Returns the value of a node below the root, with agentInd and depth
+          as the agent's own recursion passes them.  Alpha is a lower bound
+          already achieved at the root, for agents that prune.
+        """
+        util.raiseNotDefined()
+
+    def getReplyAgents(self, numAgents):
+        """
+          Returns the agent that moves at a root child in this agent's search,
+          and the agentInd its recursion passes to the resulting states.
+        """
+        util.raiseNotDefined()
+
+    def combineReplies(self, values):
+        return min(values)
+
+    def getParallelAction(self, gameState):
+        """
+          Searches the root actions in parallel and returns the same action
+          as the serial search.  With splitReplies, each reply to a root
+          action is its own task.  Finished root values raise a shared alpha
+          that workers read when they start a task.  A pruned task returns
+          an upper bound that can tie with the best value, so ties are
+          searched again with a full window.  Every action is then exact or
+          known to be worse, and the first best action is chosen as the
+          serial search chooses it.
+        """
+        import multiprocessing
+        if self.pool is None:
+            self.sharedAlpha = multiprocessing.Value('d', -sys.maxsize)
+            self.pool = multiprocessing.Pool(self.workers, _initSearchWorker, (self, self.sharedAlpha))
+        self.sharedAlpha.value = -sys.maxsize
+
+        numAgents = gameState.getNumAgents()
+        depth = self.depth * numAgents - 1
+        actions = gameState.getLegalActions(0)
+        children = [gameState.generateSuccessor(0, action) for action in actions]
+        tasks = []
+        results = []
+        for i, child in enumerate(children):
+            if self.splitReplies and depth > 0 and not child.isWin() and not child.isLose():
+                replyAgent, nextAgent = self.getReplyAgents(numAgents)
+                replies = child.getLegalActions(replyAgent)
+                for j, reply in enumerate(replies):
+                    tasks.append((i, j, child.generateSuccessor(replyAgent, reply), nextAgent, depth - 1))
+                results.append([None] * len(replies))
+            else:
+                tasks.append((i, None, child, 1, depth))
+                results.append([None])
+
+        values = [None] * len(actions)
+        for i, j, value in self.pool.imap_unordered(_searchTask, tasks):
+            if j is None:
+                values[i] = value
+            else:
+                results[i][j] = value
+                if None in results[i]: continue
+                values[i] = self.combineReplies(results[i])
+            self.sharedAlpha.value = max(self.sharedAlpha.value, values[i])
+
+        bestValue = max(values)
+        if values.count(bestValue) > 1:
+            for i in range(len(actions)):
+                if values[i] == bestValue:
+                    values[i] = self.searchNode(children[i], 1, depth, -sys.maxsize)
+        return actions[values.index(max(values))]
 
 class MinimaxAgent(MultiAgentSearchAgent):
     def getMiniMaxValue(self, gameState, agentInd, depth):
@@ -100,6 +584,13 @@ class MinimaxAgent(MultiAgentSearchAgent):
         if depth is 0 or gameState.isWin() or gameState.isLose():
             return self.evaluationFunction(gameState)
 
+        table = self.transpositionTable
+        if table is not None:
+            key = self.getTableKey(gameState, agentInd)
+            entry = table.lookup(key, depth)
+            if entry is not None:
+                return entry[1]
+
         # get next game states
         nextStates = [gameState.generateSuccessor(agentInd, action)
                       for action in gameState.getLegalActions(agentInd)]
@@ -108,13 +599,26 @@ class MinimaxAgent(MultiAgentSearchAgent):
         numAgents = gameState.getNumAgents()
         # get max for pacman
         if agentInd is 0:
-            return max([self.getMiniMaxValue(state, 1, depth) for state in nextStates])
-
+            value = max([self.getMiniMaxValue(state, 1, depth) for state in nextStates])
         # min layer for each ghost
-        return min([self.getMiniMaxValue(state, (agentInd + 1) % numAgents, depth)
-                    for state in nextStates])
+        else:
+            value = min([self.getMiniMaxValue(state, (agentInd + 1) % numAgents, depth)
+                         for state in nextStates])
+
+        if table is not None:
+            table.store(key, depth + 1, TranspositionTable.EXACT, value)
+        return value
+
+    def searchNode(self, gameState, agentInd, depth, alpha):
+        return self.getMiniMaxValue(gameState, agentInd, depth)
+
+    def getReplyAgents(self, numAgents):
+        return 1, 2 % numAgents
+
+    def searchAction(self, gameState):
+        if self.workers > 0:
+            return self.getParallelAction(gameState)
 
-    def getAction(self, gameState):
         # get initial actions
         actions = gameState.getLegalActions(0)
         nextStates = [gameState.generateSuccessor(0, action) for action in actions]
@@ -136,36 +640,132 @@ class MinimaxAgent(MultiAgentSearchAgent):
 class AlphaBetaAgent(MultiAgentSearchAgent):
     """
       Returns the minimax action using self.depth and self.evaluationFunction
+
+      ordering=pv+killers+history+static (any '+'-separated subset, or
+      'none') turns on move ordering (see MoveOrdering) and reports the
+      number of nodes searched at the end of each game.
     """
+    def __init__(self, ordering = '', **args):
+        MultiAgentSearchAgent.__init__(self, **args)
+        self.moveOrdering = None
+        if ordering == 'none':
+            self.moveOrdering = MoveOrdering([])
+        elif ordering:
+            self.moveOrdering = MoveOrdering(ordering.split('+'))
+        self.nodesSearched = 0
+        self.movesSearched = 0
+
+    def getSearchName(self):
+        # the move ordering can break ties between equal actions differently
+        name = MultiAgentSearchAgent.getSearchName(self)
+        if self.moveOrdering is None:
+            return name
+        return name + '/' + '+'.join(self.moveOrdering.heuristics)
+
     def getAlphaBeta(self, gameState, agentInd, a, b, depth):
+        self.nodesSearched += 1
         # evaluate state when max depth reached or end of game
         if depth is 0 or gameState.isWin() or gameState.isLose():
             return self.evaluationFunction(gameState)
+        self.checkDeadline()
+
+        # narrow the window with what an earlier search of this position proved
+        table = self.transpositionTable
+        ordering = self.moveOrdering
+        pvAction = None
+        if table is not None:
+            key = self.getTableKey(gameState, agentInd)
+            entry = table.lookup(key, depth)
+            if entry is not None:
+                flag, value, bestAction = entry
+                if flag == TranspositionTable.EXACT:
+                    return value
+                if flag == TranspositionTable.LOWER:
+                    a = max(a, value)
+                else:
+                    b = min(b, value)
+                if a >= b:
+                    return value
+            alphaOrig, betaOrig = a, b
+            if ordering is not None and ordering.usePV:
+                pvAction = table.getBestAction(key)
 
         # get max for pacman
         depth -= 1
+        bestAction = None
 
         if agentInd is 0:
             v = -sys.maxsize
-            for action in gameState.getLegalActions(agentInd):
+            actions = gameState.getLegalActions(agentInd)
+            if ordering is not None:
+                actions = ordering.orderActions(gameState, agentInd, actions, depth, True, pvAction)
+            for action in actions:
                 state = gameState.generateSuccessor(agentInd, action)
-                v = max(self.getAlphaBeta(state, 1, a, b, depth), v)
+                value = self.getAlphaBeta(state, 1, a, b, depth)
+                if value > v or bestAction is None:
+                    v, bestAction = max(value, v), action
                 if v >= b:
+                    if ordering is not None:
+                        ordering.recordCutoff(gameState, agentInd, action, depth)
                     break
                 a = max(a, v)
-            return v
         else:
             v = sys.maxsize
             agentInd = (agentInd + 1) % gameState.getNumAgents()
-            for action in gameState.getLegalActions(agentInd):
+            actions = gameState.getLegalActions(agentInd)
+            if ordering is not None:
+                actions = ordering.orderActions(gameState, agentInd, actions, depth, False, pvAction)
+            for action in actions:
                 state = gameState.generateSuccessor(agentInd, action)
-                v = min(self.getAlphaBeta(state, agentInd, a, b, depth), v)
+                value = self.getAlphaBeta(state, agentInd, a, b, depth)
+                if value < v or bestAction is None:
+                    v, bestAction = min(value, v), action
                 if v <= a:
+                    if ordering is not None:
+                        ordering.recordCutoff(gameState, agentInd, action, depth)
                     break
                 b = min(b, v)
-            return v
 
-    def getAction(self, gameState):
+        if table is not None:
+            if v <= alphaOrig:
+                flag = TranspositionTable.UPPER
+            elif v >= betaOrig:
+                flag = TranspositionTable.LOWER
+            else:
+                flag = TranspositionTable.EXACT
+            table.store(key, depth + 1, flag, v, bestAction)
+        return v
+
+    def getRootValues(self, gameState, actions, depth):
+        # raise alpha across the root actions; pruned actions get upper bounds
+        if self.moveOrdering is not None:
+            self.moveOrdering.newSearch()
+        depth = depth * gameState.getNumAgents() - 1
+        a = -sys.maxsize
+        b = sys.maxsize
+        values = []
+        for action in actions:
+            value = self.getAlphaBeta(gameState.generateSuccessor(0, action), 1, a, b, depth)
+            values.append(value)
+            a = max(a, value)
+        return values
+
+    def searchNode(self, gameState, agentInd, depth, alpha):
+        return self.getAlphaBeta(gameState, agentInd, alpha, sys.maxsize, depth)
+
+    def getReplyAgents(self, numAgents):
+        # getAlphaBeta's min layer advances agentInd before moving
+        return 2 % numAgents, 2 % numAgents
+
+    def searchAction(self, gameState):
+        self.movesSearched += 1
+        if self.anytime:
+            return self.getAnytimeAction(gameState)
+        if self.workers > 0:
+            return self.getParallelAction(gameState)
+        if self.moveOrdering is not None:
+            self.moveOrdering.newSearch()
+
         # get initial actions
         actions = gameState.getLegalActions(0)
         nextStates = [gameState.generateSuccessor(0, action) for action in actions]
@@ -186,12 +786,226 @@ class AlphaBetaAgent(MultiAgentSearchAgent):
 
         return action
 
+    def final(self, gameState):
+        MultiAgentSearchAgent.final(self, gameState)
+        if self.moveOrdering is not None and self.movesSearched > 0:
+            print "Alpha-beta: %d nodes over %d moves (%.1f per move)" % \
+                (self.nodesSearched, self.movesSearched, float(self.nodesSearched) / self.movesSearched)
+        self.nodesSearched = self.movesSearched = 0
+
 
 class ExpectimaxAgent(MultiAgentSearchAgent):
+    """
+      Expectimax with two optional refinements, both searched by getStarValue
+      instead of getExpectimax:
+
+        ghostModel=RandomGhost or DirectionalGhost (any GhostAgent in
+                 ghostAgents.py) weights each ghost reply by that agent's
+                 getDistribution instead of averaging the replies uniformly;
+                 replies of probability 0 are skipped
+        probThreshold=p  also skips replies the model gives a probability
+                 below p (the likeliest reply is always kept) and averages
+                 over the rest
+        pruning=star1 or star2 prunes chance nodes (Ballard's Star1, and
+                 Star2's probing of each reply's first Pacman move) once the
+                 replies left cannot move the average into the window.  This
+                 needs evalBounds=lo+hi, bounds on the evaluation function
+                 (relative to the score of the state searched from when
+                 relativeBounds=True).  With scoreEvaluationFunction,
+                 -1100+1500 relative covers a loss, the win bonus and eaten
+                 ghosts at the usual depths.  A move whose search meets an
+                 evaluation outside the bounds is searched again without
+                 pruning
+
+      Without a ghost model the pruned search chooses the same actions as the
+      plain one.  Neither uses the transposition table.
+
+      The model's distributions are cached by the ghost's position,
+      direction and scaredness and Pacman's position, which is all the
+      ghosts in ghostAgents.py look at besides the walls; the cache is
+      emptied when the agent is given a state on a different layout.
+    """
+    PRUNINGS = ['none', 'star1', 'star2']
+    EPSILON = 1e-6 # slack on child windows for floating-point rounding
+
+    def __init__(self, pruning = 'none', evalBounds = '', relativeBounds = 'False', ghostModel = 'uniform',
+                 probThreshold = '0', **args):
+        MultiAgentSearchAgent.__init__(self, **args)
+        if pruning not in ExpectimaxAgent.PRUNINGS:
+            raise Exception('Unknown expectimax pruning: ' + pruning)
+        if pruning != 'none' and not evalBounds:
+            raise Exception('Pruning expectimax needs evalBounds=lo+hi')
+        self.pruning = pruning
+        self.evalBounds = None
+        if evalBounds:
+            self.evalBounds = tuple([float(x) for x in evalBounds.split('+')])
+        self.relativeBounds = str(relativeBounds) == 'True'
+        self.ghostModel = ghostModel
+        self.ghostAgents = {}
+        self.probThreshold = float(probThreshold)
+        if self.probThreshold > 0 and ghostModel == 'uniform':
+            raise Exception('probThreshold needs a ghostModel')
+        self.distributions = {}
+        self.distributionLayout = None
+        self.distributionProbes = 0
+        self.distributionHits = 0
+        self.boundsFailures = 0
+
+    def getSearchName(self):
+        # a ghost model changes the values, and pruning with evalBounds that
+        # do not hold can change the action chosen
+        name = MultiAgentSearchAgent.getSearchName(self)
+        if self.pruning != 'none':
+            name += '/%s/%s/%s' % (self.pruning, self.evalBounds, self.relativeBounds)
+        if self.ghostModel != 'uniform':
+            name += '/%s/%s' % (self.ghostModel, self.probThreshold)
+        return name
+
+    def getGhostWeights(self, gameState, agentInd, actions):
+        """
+          The weight of each of the ghost's actions: 1.0 each for the uniform
+          model, otherwise the model ghost's probability of the action, or 0
+          if it is below probThreshold.
+        """
+        if self.ghostModel == 'uniform':
+            return [1.0] * len(actions)
+        layout = gameState.data.layout
+        if layout is not self.distributionLayout:
+            # the distributions depend on the walls, which the key leaves out
+            if self.distributionLayout is None or layout.layoutText != self.distributionLayout.layoutText:
+                self.distributions = {}
+            self.distributionLayout = layout
+        ghostState = gameState.data.agentStates[agentInd]
+        conf = ghostState.configuration
+        key = (agentInd, conf.pos, conf.direction, ghostState.scaredTimer > 0, gameState.getPacmanPosition())
+        self.distributionProbes += 1
+        weights = self.distributions.get(key)
+        if weights is not None:
+            self.distributionHits += 1
+        else:
+            if agentInd not in self.ghostAgents:
+                import ghostAgents
+                self.ghostAgents[agentInd] = getattr(ghostAgents, self.ghostModel)(agentInd)
+            dist = self.ghostAgents[agentInd].getDistribution(gameState)
+            likeliest = max([dist[action] for action in actions])
+            weights = {}
+            for action in actions:
+                if dist[action] >= min(self.probThreshold, likeliest): weights[action] = dist[action]
+            self.distributions[key] = weights
+        return [weights.get(action, 0.0) for action in actions]
+
+    def getStarValue(self, gameState, agentInd, depth, alpha, beta, firstValue=None):
+        """
+          The expectimax value of the state if it lies inside (alpha, beta);
+          otherwise a bound on the wrong side of the window (alpha or beta
+          itself at chance nodes).  firstValue, if known, is the exact value
+          of Pacman's first action here.
+        """
+        if depth is 0 or gameState.isWin() or gameState.isLose():
+            value = self.evaluationFunction(gameState)
+            if not self.low <= value <= self.high:
+                raise EvalBoundsError(value)
+            return value
+        self.checkDeadline()
+        actions = gameState.getLegalActions(agentInd)
+        nextInd = (agentInd + 1) % gameState.getNumAgents()
+
+        if agentInd is 0:
+            best = float('-inf')
+            for i, action in enumerate(actions):
+                if i == 0 and firstValue is not None:
+                    value = firstValue
+                else:
+                    value = self.getStarValue(gameState.generateSuccessor(0, action), nextInd, depth - 1, max(alpha, best), beta)
+                best = max(best, value)
+                if best >= beta:
+                    break
+            return best
+
+        replies = [(weight, gameState.generateSuccessor(agentInd, action))
+                   for action, weight in zip(actions, self.getGhostWeights(gameState, agentInd, actions)) if weight > 0]
+        total = sum([weight for weight, state in replies])
+
+        # lower bounds on the replies' values: the evaluation bound, or for
+        # star2 the exact value of Pacman's first move after the reply
+        lows = [self.low] * len(replies)
+        firstValues = [None] * len(replies)
+        if self.pruning == 'star2' and nextInd is 0 and depth > 1:
+            for i, (weight, state) in enumerate(replies):
+                if state.isWin() or state.isLose(): continue
+                first = state.getLegalActions(0)[0]
+                firstValues[i] = lows[i] = self.getStarValue(state.generateSuccessor(0, first), 1, depth - 2, self.low, self.high)
+            if sum([weight * low for (weight, state), low in zip(replies, lows)]) / total >= beta:
+                return beta
+
+        # what the replies after each one can still add, at least and at most
+        restLow = [0.0] * len(replies)
+        restHigh = [0.0] * len(replies)
+        for i in range(len(replies) - 2, -1, -1):
+            weight = replies[i + 1][0]
+            restLow[i] = restLow[i + 1] + weight * lows[i + 1]
+            restHigh[i] = restHigh[i + 1] + weight * self.high
+
+        weighted = 0.0
+        for i, (weight, state) in enumerate(replies):
+            childAlpha = (alpha * total - weighted - restHigh[i]) / weight - ExpectimaxAgent.EPSILON
+            childBeta = (beta * total - weighted - restLow[i]) / weight + ExpectimaxAgent.EPSILON
+            value = self.getStarValue(state, nextInd, depth - 1, childAlpha, childBeta, firstValues[i])
+            if value <= childAlpha: return alpha
+            if value >= childBeta: return beta
+            weighted += weight * value
+        return weighted / total
+
+    def getStarRootValues(self, gameState, actions, depth):
+        """
+          getStarValue of each action's successor, each searched with the
+          best value so far as alpha: an action that cannot beat it gets
+          that value back.  If the pruned search meets an evaluation outside
+          evalBounds, its pruning cannot be trusted and the move is searched
+          again without it.
+        """
+        try:
+            return self.searchStarRoot(gameState, actions, depth, self.pruning != 'none')
+        except EvalBoundsError:
+            self.boundsFailures += 1
+            return self.searchStarRoot(gameState, actions, depth, False)
+
+    def searchStarRoot(self, gameState, actions, depth, prune):
+        self.low, self.high = float('-inf'), float('inf')
+        if prune:
+            self.low, self.high = self.evalBounds
+            if self.relativeBounds:
+                self.low += gameState.getScore()
+                self.high += gameState.getScore()
+        depth = depth * gameState.getNumAgents() - 1
+        values = []
+        best = float('-inf')
+        for action in actions:
+            value = self.getStarValue(gameState.generateSuccessor(0, action), 1, depth, best, float('inf'))
+            values.append(value)
+            best = max(best, value)
+        return values
+
+    def usesStar(self):
+        return self.pruning != 'none' or self.ghostModel != 'uniform'
+
+    def getStarAction(self, gameState):
+        actions = gameState.getLegalActions(0)
+        values = self.getStarRootValues(gameState, actions, self.depth)
+        return actions[values.index(max(values))]
+
     def getExpectimax(self, gameState, agentInd, depth):
         # evaluate state when max depth reached or end of game
         if depth is 0 or gameState.isWin() or gameState.isLose():
             return self.evaluationFunction(gameState)
+        self.checkDeadline()
+
+        table = self.transpositionTable
+        if table is not None:
+            key = self.getTableKey(gameState, agentInd)
+            entry = table.lookup(key, depth)
+            if entry is not None:
+                return entry[1]
 
         # get next game states
         nextStates = [gameState.generateSuccessor(agentInd, action)
@@ -202,11 +1016,38 @@ class ExpectimaxAgent(MultiAgentSearchAgent):
 
         # get max for pacman
         if agentInd is 0:
-            return max(values)
+            value = max(values)
+        else:
+            value = float(reduce(lambda x, y: x + y, values)) / len(values)
 
+        if table is not None:
+            table.store(key, depth, TranspositionTable.EXACT, value)
+        return value
+
+    def getRootValues(self, gameState, actions, depth):
+        if self.usesStar():
+            return self.getStarRootValues(gameState, actions, depth)
+        depth = depth * gameState.getNumAgents() - 1
+        return [self.getExpectimax(gameState.generateSuccessor(0, action), 1, depth)
+                for action in actions]
+
+    def searchNode(self, gameState, agentInd, depth, alpha):
+        return self.getExpectimax(gameState, agentInd, depth)
+
+    def getReplyAgents(self, numAgents):
+        return 1, 2 % numAgents
+
+    def combineReplies(self, values):
         return float(reduce(lambda x, y: x + y, values)) / len(values)
 
-    def getAction(self, gameState):
+    def searchAction(self, gameState):
+        if self.anytime:
+            return self.getAnytimeAction(gameState)
+        if self.usesStar():
+            return self.getStarAction(gameState)
+        if self.workers > 0:
+            return self.getParallelAction(gameState)
+
         # get initial actions
         actions = gameState.getLegalActions(0)
         nextStates = [gameState.generateSuccessor(0, action) for action in actions]
@@ -227,6 +1068,249 @@ class ExpectimaxAgent(MultiAgentSearchAgent):
 
         return action
 
+    def final(self, gameState):
+        MultiAgentSearchAgent.final(self, gameState)
+        if self.ghostModel != 'uniform':
+            print "Ghost distribution cache: %d entries, %d probes, %d hits" % \
+                (len(self.distributions), self.distributionProbes, self.distributionHits)
+        self.distributionProbes = self.distributionHits = 0
+        if self.boundsFailures > 0:
+            print "Expectimax: %d moves searched again without pruning (evaluations outside evalBounds)" % self.boundsFailures
+            self.boundsFailures = 0
+
+
+class MCTSNode:
+    """
+      A state where Pacman moves in an MCTSAgent's tree.  Each of Pacman's
+      actions leads to the states the ghosts' replies to it have produced so
+      far, keyed by the replies.
+    """
+    def __init__(self, gameState):
+        self.state = gameState
+        self.actions = []
+        if not gameState.isWin() and not gameState.isLose():
+            self.actions = gameState.getLegalActions(0)
+        self.untried = list(self.actions)
+        self.children = dict([(action, {}) for action in self.actions])
+        self.visits = dict([(action, 0) for action in self.actions])
+        self.values = dict([(action, 0.0) for action in self.actions])
+        self.totalVisits = 0
+
+class MCTSAgent(MultiAgentSearchAgent):
+    """
+      Monte Carlo tree search (UCT).  Each iteration walks down the tree,
+      choosing Pacman's actions by UCB1 and sampling the ghosts' replies
+      from ghostModel, adds the first state it has not seen to the tree,
+      plays a rollout of up to rolloutDepth moves from there and scores the
+      rollout's last state with the evaluation function.  The root action
+      visited most often is played.
+
+        iterations=n       iterations per move, or
+        moveTime=s         seconds per move instead (anytime=True takes the
+                           seconds from the game's time limits, as the
+                           other agents' anytime search does)
+        rolloutPolicy      'random' or 'greedy' (toward the nearest food)
+                           Pacman moves in rollouts; neither stops
+        ghostModel         the GhostAgent in ghostAgents.py the ghosts are
+                           sampled from, in the tree and in rollouts
+        exploration=c      UCB1's constant, in units of the spread of the
+                           rollout values seen so far
+        reuseTree=True     keeps the subtree of the state actually reached
+                           for the next move
+        workers=n          root parallelism: each worker searches its own
+                           tree from the root with its own seed and the
+                           root statistics are summed (no tree reuse)
+        seed=n             seeds the agent's own random numbers, which are
+                           otherwise seeded from the random module
+    """
+    ROLLOUT_POLICIES = ['random', 'greedy']
+    GREEDY_EPSILON = 0.1 # chance of a random move in a greedy rollout
+
+    def __init__(self, iterations = '200', moveTime = '0', rolloutDepth = '10',
+                 rolloutPolicy = 'random', ghostModel = 'RandomGhost',
+                 exploration = '0.7', reuseTree = 'False', seed = '', **args):
+        MultiAgentSearchAgent.__init__(self, **args)
+        if rolloutPolicy not in MCTSAgent.ROLLOUT_POLICIES:
+            raise Exception('Unknown rollout policy: ' + rolloutPolicy)
+        self.iterations = int(iterations)
+        self.moveTime = float(moveTime)
+        self.rolloutDepth = int(rolloutDepth)
+        self.rolloutPolicy = rolloutPolicy
+        self.ghostModel = ghostModel
+        self.ghostAgents = {}
+        self.exploration = float(exploration)
+        self.reuseTree = str(reuseTree) == 'True'
+        if seed:
+            self.random = random.Random(int(seed))
+        else:
+            self.random = random.Random(random.random())
+        self.root = None
+        self.low, self.high = float('inf'), float('-inf')
+        self.movesSearched = 0
+        self.iterationsRun = 0
+        self.visitsReused = 0
+
+    def getSearchName(self):
+        return '%s/%d/%s/%s/%d' % (self.__class__.__name__, self.iterations,
+                                    self.rolloutPolicy, self.ghostModel, self.rolloutDepth)
+
+    def sample(self, dist, actions):
+        "Draws one of the actions with the weights dist gives them"
+        weights = [dist[action] for action in actions]
+        r = self.random.random() * sum(weights)
+        for action, weight in zip(actions, weights):
+            r -= weight
+            if r < 0: return action
+        return actions[-1]
+
+    def moveGhosts(self, gameState):
+        """
+          Plays one move of every ghost sampled from the ghost model, and
+          returns the resulting state and the ghosts' actions.
+        """
+        import ghostAgents
+        replies = []
+        for agentInd in range(1, gameState.getNumAgents()):
+            if gameState.isWin() or gameState.isLose():
+                break
+            if agentInd not in self.ghostAgents:
+                self.ghostAgents[agentInd] = getattr(ghostAgents, self.ghostModel)(agentInd)
+            actions = gameState.getLegalActions(agentInd)
+            action = self.sample(self.ghostAgents[agentInd].getDistribution(gameState), actions)
+            gameState = gameState.generateSuccessor(agentInd, action)
+            replies.append(action)
+        return gameState, tuple(replies)
+
+    def getRolloutAction(self, gameState):
+        actions = gameState.getLegalActions(0)
+        if len(actions) > 1 and Directions.STOP in actions:
+            actions.remove(Directions.STOP)
+        if self.rolloutPolicy == 'greedy' and self.random.random() >= MCTSAgent.GREEDY_EPSILON:
+            x, y = gameState.getPacmanPosition()
+            targets = [(x + dx, y + dy) for dx, dy in [Actions.directionToVector(action, 1) for action in actions]]
+            # food next door needs no scan of the board
+            eating = [action for action, (nx, ny) in zip(actions, targets) if gameState.hasFood(nx, ny)]
+            if eating:
+                return self.random.choice(eating)
+            foodList = gameState.getFood().asList()
+            if foodList:
+                distances = [min([manhattanDistance(target, food) for food in foodList]) for target in targets]
+                actions = [action for action, distance in zip(actions, distances) if distance == min(distances)]
+        return self.random.choice(actions)
+
+    def rollout(self, gameState):
+        for i in range(self.rolloutDepth):
+            if gameState.isWin() or gameState.isLose():
+                break
+            gameState = gameState.generateSuccessor(0, self.getRolloutAction(gameState))
+            gameState = self.moveGhosts(gameState)[0]
+        return self.evaluationFunction(gameState)
+
+    def selectAction(self, node):
+        "UCB1 over the node's actions, all of which have been tried"
+        spread = max(self.high - self.low, 1.0)
+        logVisits = math.log(node.totalVisits)
+        def ucb(action):
+            visits = node.visits[action]
+            return node.values[action] / visits + self.exploration * spread * math.sqrt(logVisits / visits)
+        return max(node.actions, key=ucb)
+
+    def runIteration(self, root):
+        node, path = root, []
+        while node.actions:
+            if node.untried:
+                action = node.untried.pop(self.random.randrange(len(node.untried)))
+            else:
+                action = self.selectAction(node)
+            path.append((node, action))
+            successor, replies = self.moveGhosts(node.state.generateSuccessor(0, action))
+            outcomes = node.children[action]
+            if replies not in outcomes:
+                node = outcomes[replies] = MCTSNode(successor)
+                break
+            node = outcomes[replies]
+
+        value = self.rollout(node.state)
+        self.low = min(self.low, value)
+        self.high = max(self.high, value)
+        for node, action in path:
+            node.totalVisits += 1
+            node.visits[action] += 1
+            node.values[action] += value
+        self.iterationsRun += 1
+
+    def search(self, root, gameState):
+        """
+          Runs iterations from root until the move's budget is spent (at
+          least one).
+        """
+        self.low, self.high = float('inf'), float('-inf')
+        if self.anytime or self.moveTime > 0:
+            budget = self.moveTime
+            if self.anytime:
+                budget = self.getMoveBudget(gameState)
+            deadline = time.time() + budget
+            self.runIteration(root)
+            while time.time() < deadline:
+                self.runIteration(root)
+        else:
+            for i in range(self.iterations):
+                self.runIteration(root)
+
+    def findRoot(self, gameState):
+        """
+          The node of the previous move's tree for the state reached, or a
+          new node.
+        """
+        if self.reuseTree and self.root is not None:
+            for outcomes in self.root.children.values():
+                for node in outcomes.values():
+                    if node.state == gameState:
+                        self.visitsReused += node.totalVisits
+                        return node
+        return MCTSNode(gameState)
+
+    def getRootStatistics(self, gameState, seed):
+        "Searches a new tree from gameState; returns its root's visits and values"
+        self.random.seed(seed)
+        root = MCTSNode(gameState)
+        self.search(root, gameState)
+        return root.visits, root.values
+
+    def getParallelAction(self, gameState):
+        import multiprocessing
+        if self.pool is None:
+            self.root = None
+            self.pool = multiprocessing.Pool(self.workers, _initSearchWorker, (self, None))
+        tasks = [(gameState, self.random.random()) for i in range(self.workers)]
+        actions = gameState.getLegalActions(0)
+        visits = dict([(action, 0) for action in actions])
+        for rootVisits, rootValues in self.pool.imap_unordered(_treeSearchTask, tasks):
+            for action in actions:
+                visits[action] += rootVisits[action]
+        return max(actions, key=lambda action: visits[action])
+
+    def searchAction(self, gameState):
+        startTime = time.time()
+        self.movesSearched += 1
+        if self.workers > 0:
+            action = self.getParallelAction(gameState)
+        else:
+            root = self.findRoot(gameState)
+            self.search(root, gameState)
+            action = max(root.actions, key=lambda action: root.visits[action])
+            self.root = root
+        self.totalTime += time.time() - startTime
+        return action
+
+    def final(self, gameState):
+        MultiAgentSearchAgent.final(self, gameState)
+        if self.workers == 0:
+            print "MCTS: %d iterations over %d moves, %d visits reused" % \
+                (self.iterationsRun, self.movesSearched, self.visitsReused)
+        self.root = None
+        self.movesSearched = self.iterationsRun = self.visitsReused = 0
+
 
 def ManhDistCmp(pos, p1, p2):
     """
@@ -249,7 +1333,7 @@ def betterEvaluationFunction(currentGameState):
         read comments please :)
     """
     pacPos = currentGameState.getPacmanPosition()
-    foodList = currentGameState.getFood().asList()
+    foodList = currentGameState.getFoodFeatures().getFoodList()
 
     # just like quicksort, there is a higher probability of finding an effective index
     # by selecting a random element in the array
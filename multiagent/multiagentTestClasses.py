@@ -135,7 +135,11 @@ def run(lay, layName, pac, ghosts, disp, nGames=1, name='games'):
     """
     starttime = time.time()
     print '*** Running %s on' % name, layName, '%d time(s).' % nGames
-    games = pacman.runGames(lay, pac, ghosts, disp, nGames, False, catchExceptions=True, timeout=120)
+    previous = GameState.setFoodCountCheck(True)
+    try:
+        games = pacman.runGames(lay, pac, ghosts, disp, nGames, False, catchExceptions=True, timeout=120)
+    finally:
+        GameState.setFoodCountCheck(previous)
     print '*** Finished running %s on' % name, layName, 'after %d seconds.' % (time.time() - starttime)
     stats = {'time': time.time() - starttime, 'wins': [g.state.isWin() for g in games].count(True), 'games': games, 'scores': [g.state.getScore() for g in games],
              'timeouts': [g.agentTimeout for g in games].count(True), 'crashes': [g.agentCrashed for g in games].count(True)}
@@ -310,7 +314,11 @@ class PacmanGameTreeTest(testClasses.TestCase):
         pac = GradingAgent(self.seed, studentAgent, allActions, altDepthActions, partialPlyBugActions)
         # check return codes and assign grades
         disp = self.question.getDisplay()
-        stats = run(lay, self.layout_name, pac, [DirectionalGhost(i + 1) for i in range(2)], disp, name=self.alg)
+        previous = GameState.setExplorationTracker(pacman.ExactExplorationTracker())
+        try:
+            stats = run(lay, self.layout_name, pac, [DirectionalGhost(i + 1) for i in range(2)], disp, name=self.alg)
+        finally:
+            GameState.setExplorationTracker(previous)
         if stats['timeouts'] > 0:
             self.addMessage('Agent timed out on smallClassic.  No credit')
             return self.testFail(grades)
@@ -358,7 +366,11 @@ class PacmanGameTreeTest(testClasses.TestCase):
             ourPacOptions = {}
         pac = PolyAgent(self.seed, multiAgents, ourPacOptions, self.depth)
         disp = self.question.getDisplay()
-        run(lay, self.layout_name, pac, [DirectionalGhost(i + 1) for i in range(2)], disp, name=self.alg)
+        previous = GameState.setExplorationTracker(pacman.ExactExplorationTracker())
+        try:
+            run(lay, self.layout_name, pac, [DirectionalGhost(i + 1) for i in range(2)], disp, name=self.alg)
+        finally:
+            GameState.setExplorationTracker(previous)
         (optimalActions, altDepthActions, partialPlyBugActions) = pac.getTraces()
         # recover traces and record to file
         handle = open(filePath, 'w')
@@ -462,7 +474,11 @@ class EvalAgentTest(testClasses.TestCase):
         disp = self.question.getDisplay()
 
         random.seed(self.seed)
-        games = pacman.runGames(lay, agent, self.ghosts, disp, self.numGames, False, catchExceptions=True, timeout=self.maxTime)
+        previous = GameState.setFoodCountCheck(True)
+        try:
+            games = pacman.runGames(lay, agent, self.ghosts, disp, self.numGames, False, catchExceptions=True, timeout=self.maxTime)
+        finally:
+            GameState.setFoodCountCheck(previous)
         totalTime = time.time() - startTime
 
         stats = {'time': totalTime, 'wins': [g.state.isWin() for g in games].count(True),
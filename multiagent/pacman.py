@@ -40,19 +40,102 @@ To play your first game, type 'python pacman.py' from the command line.
 The keys are 'a', 's', 'd', and 'w' to move (or arrow keys).  Have fun!
 """
 from game import GameStateData
+from game import getSlotState
+from game import setSlotState
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
 from util import nearestPoint
 from util import manhattanDistance
 import util, layout
-import sys, types, time, random, os
+import sys, types, time, random, os, math
+
+########################
+# EXPLORATION TRACKERS #
+########################
+
+class ExactExplorationTracker:
+    """
+    Keeps the set of every state a successor was generated from or to, as
+    the grader counts explored states.  Each successor hashes two states.
+    """
+    def __init__( self ):
+        self.explored = set()
+
+    def add( self, parent, child ):
+        self.explored.add( parent )
+        self.explored.add( child )
+
+    def count( self ):
+        return len( self.explored )
+
+    def reset( self ):
+        self.explored = set()
+
+class CountingExplorationTracker:
+    """
+    Counts the successors generated, repeats included.
+    """
+    def __init__( self ):
+        self.successors = 0
+
+    def add( self, parent, child ):
+        self.successors += 1
+
+    def count( self ):
+        return self.successors
+
+    def reset( self ):
+        self.successors = 0
+
+class HyperLogLogExplorationTracker:
+    """
+    Estimates the number of distinct states the exact tracker would keep,
+    in 2^precision registers, from the states' Zobrist hashes (which need no
+    hashing of the state).  The standard error is about 1.04 / sqrt(2^precision).
+    """
+    def __init__( self, precision=12 ):
+        self.precision = precision
+        self.reset()
+
+    def add( self, parent, child ):
+        self.addState( parent.data )
+        self.addState( child.data )
+
+    def addState( self, data ):
+        # States are equal only if their scores are too, which the Zobrist
+        # hash leaves out.  And Zobrist hashes are XORs of shared keys, so
+        # related states collide in the same bits: MurmurHash3's finalizer
+        # mixes them first.
+        h = data._zobrist ^ ((hash(data.score) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF)
+        h ^= h >> 33
+        h = (h * 0xff51afd7ed558ccd) & 0xFFFFFFFFFFFFFFFF
+        h ^= h >> 33
+        h = (h * 0xc4ceb9fe1a85ec53) & 0xFFFFFFFFFFFFFFFF
+        h ^= h >> 33
+        index = h & (len(self.registers) - 1)
+        rest = h >> self.precision
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]: self.registers[index] = rank
+
+    def count( self ):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum([2.0 ** -r for r in self.registers])
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            estimate = m * math.log(float(m) / zeros) # linear counting for small sets
+        return int(round(estimate))
+
+    def reset( self ):
+        self.registers = [0] * (2 ** self.precision)
 
 ###################################################
 # YOUR INTERFACE TO THE PACMAN WORLD: A GameState #
 ###################################################
 
-class GameState:
+class GameState(object):
     """
     A GameState specifies the full game state, including the food, capsules,
     agent configurations and score changes.
@@ -67,23 +150,73 @@ class GameState:
     Note that in classic Pacman, Pacman is always agent 0.
     """
 
+    __slots__ = ('data',)
+    __getstate__ = getSlotState
+    __setstate__ = setSlotState
+
     ####################################################
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
-    explored = set()
+    # static variable: the tracker told about every successor generated, or
+    # None to track nothing (see ExactExplorationTracker)
+    explorationTracker = None
+    def setExplorationTracker( tracker ):
+        """
+        Installs tracker (or None) and returns the one it replaces.
+        """
+        previous = GameState.explorationTracker
+        GameState.explorationTracker = tracker
+        return previous
+    setExplorationTracker = staticmethod(setExplorationTracker)
+
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
-        GameState.explored = set()
+        """
+        Returns the set of states explored since the last call; this needs
+        an ExactExplorationTracker.
+        """
+        tracker = GameState.explorationTracker
+        if not isinstance(tracker, ExactExplorationTracker):
+            raise Exception('getAndResetExplored needs an ExactExplorationTracker')
+        tmp = tracker.explored
+        tracker.reset()
         return tmp
     getAndResetExplored = staticmethod(getAndResetExplored)
 
+    def getAndResetExploredCount():
+        """
+        Returns the number of states explored since the last call, as the
+        installed tracker counts them (0 without one).
+        """
+        tracker = GameState.explorationTracker
+        if tracker == None: return 0
+        count = tracker.count()
+        tracker.reset()
+        return count
+    getAndResetExploredCount = staticmethod(getAndResetExploredCount)
+
+    # static variable: when True, every read and update of the food counter
+    # is checked against a count of the food grid (see checkFoodCount)
+    foodCountCheck = False
+    def setFoodCountCheck( check ):
+        """
+        Turns the food counter's consistency check on or off and returns
+        the previous setting.
+        """
+        previous = GameState.foodCountCheck
+        GameState.foodCountCheck = check
+        return previous
+    setFoodCountCheck = staticmethod(setFoodCountCheck)
+
+    def checkFoodCount( self ):
+        count = self.data.food.count()
+        if self.data._numFood != count:
+            raise Exception('Food counter is %d but the grid has %d food' % (self.data._numFood, count))
+
     def getLegalActions( self, agentIndex=0 ):
         """
         Returns the legal actions for the agent specified.
         """
-#        GameState.explored.add(self)
         if self.isWin() or self.isLose(): return []
 
         if agentIndex == 0:  # Pacman is moving
@@ -112,16 +245,18 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
         else:
-            GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
+            GhostRules.decrementTimer( state.data.writableAgentState( agentIndex ) )
 
         # Resolve multi-agent effects
         GhostRules.checkDeath( state, agentIndex )
 
         # Book keeping
         state.data._agentMoved = agentIndex
+        state.data._ply += 1
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        state.data.updateHash( self.data )
+        if GameState.explorationTracker != None:
+            GameState.explorationTracker.add( self, state )
         return state
 
     def getLegalPacmanActions( self ):
@@ -174,7 +309,32 @@ class GameState:
         return self.data.capsules
 
     def getNumFood( self ):
-        return self.data.food.count()
+        if GameState.foodCountCheck: self.checkFoodCount()
+        return self.data._numFood
+
+    def toBytes( self ):
+        """
+        Returns the state, less its layout, as a compact string of bytes
+        (see GameStateData.toBytes).  Pickling a state uses the same format.
+        """
+        return self.data.toBytes()
+
+    def fromBytes( data, layout ):
+        """
+        Rebuilds a GameState of the given layout from toBytes' string.
+        """
+        state = GameState()
+        state.data = GameStateData.fromBytes( data, layout )
+        return state
+    fromBytes = staticmethod( fromBytes )
+
+    def getFoodFeatures(self):
+        """
+        Returns the game.FoodFeatures of the remaining food: its list, count
+        and the nearest food to a position, kept up to date as Pacman eats
+        rather than recomputed from the grid.
+        """
+        return self.data.getFoodFeatures()
 
     def getFood(self):
         """
@@ -200,8 +360,16 @@ class GameState:
         """
         return self.data.layout.walls
 
+    def getMazeDistance(self, pos1, pos2):
+        """
+        Returns the true shortest-path distance between two positions,
+        respecting walls, from a table built once per layout (see
+        layout.py).  Returns None if there is no path.
+        """
+        return self.data.layout.getMazeDistance(pos1, pos2)
+
     def hasFood(self, x, y):
-        return self.data.food[x][y]
+        return self.data.food.get(x, y)
 
     def hasWall(self, x, y):
         return self.data.layout.walls[x][y]
@@ -212,6 +380,13 @@ class GameState:
     def isWin( self ):
         return self.data._win
 
+    def getZobristHash( self ):
+        """
+        Returns a 64-bit Zobrist hash of the agent configurations, scared
+        timers, food and capsules.  The score is not part of the hash.
+        """
+        return self.data._zobrist
+
     #############################################
     #             Helper methods:               #
     # You shouldn't need to call these directly #
@@ -277,6 +452,9 @@ class ClassicGameRules:
         initState.initialize( layout, len(ghostAgents) )
         game = Game(agents, display, self, catchExceptions=catchExceptions)
         game.state = initState
+        for index, agent in enumerate(agents):
+            if 'registerTimeLimits' in dir(agent):
+                agent.registerTimeLimits(self.getMoveTimeout(index), self.getMaxTotalTime(index))
         self.initialState = initState.deepCopy()
         self.quiet = quiet
         return game
@@ -331,18 +509,37 @@ class PacmanRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions( state.getPacmanState().configuration, state.data.layout.walls )
+        conf = state.data.agentStates[0].configuration
+        layout = state.data.layout
+        possibleActions = layout.getLegalPacmanActions( layout.getConfigurationCell( conf ) )
+        if possibleActions == None:
+            possibleActions = Actions.getPossibleActions( conf, state.data.layout.walls )
+        return possibleActions
     getLegalActions = staticmethod( getLegalActions )
 
     def applyAction( state, action ):
         """
         Edits the state to reflect the results of the action.
         """
+        layout = state.data.layout
+        conf = state.data.agentStates[0].configuration
+        moves = layout.getPacmanMoves( layout.getConfigurationCell( conf ) )
+        if moves != None:
+            # Grid point: look the move up and eat at the cell it leads to
+            if action not in moves:
+                raise Exception("Illegal action " + str(action))
+            next, cell = moves[action]
+            direction = action
+            if direction == Directions.STOP: direction = conf.direction
+            state.data.writableAgentState( 0 ).configuration = Configuration( next, direction, cell )
+            PacmanRules.consume( next, state )
+            return
+
         legal = PacmanRules.getLegalActions( state )
         if action not in legal:
             raise Exception("Illegal action " + str(action))
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data.writableAgentState( 0 )
 
         # Update Configuration
         vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
@@ -359,23 +556,26 @@ class PacmanRules:
     def consume( position, state ):
         x,y = position
         # Eat food
-        if state.data.food[x][y]:
+        if state.data.food.get(x, y):
             state.data.scoreChange += 10
             state.data.food = state.data.food.copy()
             state.data.food[x][y] = False
             state.data._foodEaten = position
-            # TODO: cache numFood?
-            numFood = state.getNumFood()
-            if numFood == 0 and not state.data._lose:
+            if state.data._foodFeatures != None:
+                state.data._foodFeatures = state.data._foodFeatures.eat( position, state.data.food )
+            state.data._numFood -= 1
+            if GameState.foodCountCheck: state.checkFoodCount()
+            if state.data._numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if( position in state.getCapsules() ):
+            state.data.capsules = state.data.capsules[:]
             state.data.capsules.remove( position )
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range( 1, len( state.data.agentStates ) ):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.writableAgentState( index ).scaredTimer = SCARED_TIME
     consume = staticmethod( consume )
 
 class GhostRules:
@@ -389,6 +589,10 @@ class GhostRules:
         reach a dead end, but can turn 90 degrees at intersections.
         """
         conf = state.getGhostState( ghostIndex ).configuration
+        layout = state.data.layout
+        legalActions = layout.getLegalGhostActions( layout.getConfigurationCell( conf ), conf.direction )
+        if legalActions != None:
+            return legalActions
         possibleActions = Actions.getPossibleActions( conf, state.data.layout.walls )
         reverse = Actions.reverseDirection( conf.direction )
         if Directions.STOP in possibleActions:
@@ -400,11 +604,24 @@ class GhostRules:
 
     def applyAction( state, action, ghostIndex):
 
+        ghostState = state.data.agentStates[ghostIndex]
+        if ghostState.scaredTimer == 0:
+            # Full speed from a grid point: look the move up
+            layout = state.data.layout
+            conf = ghostState.configuration
+            moves = layout.getGhostMoves( layout.getConfigurationCell( conf ), conf.direction )
+            if moves != None:
+                if action not in moves:
+                    raise Exception("Illegal ghost action " + str(action))
+                next, cell = moves[action]
+                state.data.writableAgentState( ghostIndex ).configuration = Configuration( next, action, cell )
+                return
+
         legal = GhostRules.getLegalActions( state, ghostIndex )
         if action not in legal:
             raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data.writableAgentState( ghostIndex )
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
         vector = Actions.directionToVector( action, speed )
@@ -414,31 +631,45 @@ class GhostRules:
     def decrementTimer( ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
+            conf = ghostState.configuration
+            ghostState.configuration = Configuration( nearestPoint( conf.pos ), conf.direction )
         ghostState.scaredTimer = max( 0, timer - 1 )
     decrementTimer = staticmethod( decrementTimer )
 
     def checkDeath( state, agentIndex):
-        pacmanPosition = state.getPacmanPosition()
+        layout = state.data.layout
+        pacmanConf = state.data.agentStates[0].configuration
         if agentIndex == 0: # Pacman just moved; Anyone can kill him
             for index in range( 1, len( state.data.agentStates ) ):
                 ghostState = state.data.agentStates[index]
-                ghostPosition = ghostState.configuration.getPosition()
-                if GhostRules.canKill( pacmanPosition, ghostPosition ):
+                if GhostRules.touches( layout, pacmanConf, ghostState.configuration ):
                     GhostRules.collide( state, ghostState, index )
         else:
             ghostState = state.data.agentStates[agentIndex]
-            ghostPosition = ghostState.configuration.getPosition()
-            if GhostRules.canKill( pacmanPosition, ghostPosition ):
+            if GhostRules.touches( layout, pacmanConf, ghostState.configuration ):
                 GhostRules.collide( state, ghostState, agentIndex )
     checkDeath = staticmethod( checkDeath )
 
+    def touches( layout, pacmanConf, ghostConf ):
+        """
+        canKill for two configurations: on grid points that is just being in
+        the same cell, otherwise the distance is checked.
+        """
+        pacmanCell = layout.getConfigurationCell( pacmanConf )
+        ghostCell = layout.getConfigurationCell( ghostConf )
+        if pacmanCell >= 0 and ghostCell >= 0:
+            return pacmanCell == ghostCell
+        return GhostRules.canKill( pacmanConf.getPosition(), ghostConf.getPosition() )
+    touches = staticmethod( touches )
+
     def collide( state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
+            ghostState = state.data.writableAgentState( agentIndex )
             state.data.scoreChange += 200
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
             # Added for first-person
+            state.data._eaten = state.data._eaten[:]
             state.data._eaten[agentIndex] = True
         else:
             if not state.data._win:
@@ -510,9 +741,15 @@ def readCommand( argv ):
     parser.add_option('-f', '--fixRandomSeed', action='store_true', dest='fixRandomSeed',
                       help='Fixes the random seed to always play the same game', default=False)
     parser.add_option('-r', '--recordActions', action='store_true', dest='record',
-                      help='Writes game histories to a file (named by the time they were played)', default=False)
+                      help='Appends the games to a game record archive (see gameRecords.py)', default=False)
+    parser.add_option('--recordFile', dest='recordFile',
+                      help=default('The archive --recordActions appends to'), default='recorded-games.pacrec')
     parser.add_option('--replay', dest='gameToReplay',
-                      help='A recorded game file (pickle) to replay', default=None)
+                      help='A game record archive, or an old recorded game file (pickle), to replay', default=None)
+    parser.add_option('--replayIndex', dest='replayIndex', type='int',
+                      help=default('Which game of a game record archive to replay'), default=0)
+    parser.add_option('--replayStart', dest='replayStart', type='int',
+                      help=default('The move to start showing the replay at'), default=0)
     parser.add_option('-a','--agentArgs',dest='agentArgs',
                       help='Comma separated values sent to agent. e.g. "opt1=val1,opt2,opt3=val3"')
     parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
@@ -523,6 +760,14 @@ def readCommand( argv ):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--seed', dest='seed', type='int',
+                      help='A base random seed: game i is played with a seed derived from it and i, with or without workers', default=None)
+    parser.add_option('--workers', dest='workers', type='int',
+                      help=default('Number of processes to play the (non-training) games in'), default=0)
+    parser.add_option('--fastSim', action='store_true', dest='fastSim',
+                      help='Plays the games without a display, timeouts or exception handling', default=False)
+    parser.add_option('--profile', action='store_true', dest='profile',
+                      help='Profiles the agents\' searches and writes a JSON report per game', default=False)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -531,6 +776,7 @@ def readCommand( argv ):
 
     # Fix the random seed
     if options.fixRandomSeed: random.seed('cs188')
+    if options.seed != None: random.seed(options.seed)
 
     # Choose a layout
     args['layout'] = layout.getLayout( options.layout )
@@ -568,17 +814,28 @@ def readCommand( argv ):
         args['display'] = graphicsDisplay.PacmanGraphics(options.zoom, frameTime = options.frameTime)
     args['numGames'] = options.numGames
     args['record'] = options.record
+    args['recordFile'] = options.recordFile
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    if options.workers > 0: args['workers'] = options.workers
+    if options.seed != None: args['seed'] = options.seed
+    if options.fastSim: args['fastSim'] = True
+    if options.profile: args['profile'] = True
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
         print 'Replaying recorded game %s.' % options.gameToReplay
-        import cPickle
-        f = open(options.gameToReplay)
-        try: recorded = cPickle.load(f)
-        finally: f.close()
+        import gameRecords, gameReplay
+        if gameRecords.isArchive(options.gameToReplay):
+            game = gameReplay.getRecordedGame(options.gameToReplay, options.replayIndex)
+            recorded = {'layout': game.layout, 'actions': game.actions, 'numGhosts': game.numAgents - 1}
+        else:
+            import cPickle
+            f = open(options.gameToReplay)
+            try: recorded = cPickle.load(f)
+            finally: f.close()
         recorded['display'] = args['display']
+        recorded['start'] = options.replayStart
         replayGame(**recorded)
         sys.exit(0)
 
@@ -607,17 +864,23 @@ def loadAgent(pacman, nographics):
                 return getattr(module, pacman)
     raise Exception('The agent ' + pacman + ' is not specified in any *Agents.py.')
 
-def replayGame( layout, actions, display ):
-    import pacmanAgents, ghostAgents
+def replayGame( layout, actions, display, start=0, numGhosts=None, quiet=False ):
+    """
+    Shows a recorded game from move start on.  The moves before start are
+    replayed without the display (see gameReplay.py).
+    """
+    import pacmanAgents, ghostAgents, gameReplay
     rules = ClassicGameRules()
-    agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1) for i in range(layout.getNumGhosts())]
-    game = rules.newGame( layout, agents[0], agents[1:], display )
-    state = game.state
+    if numGhosts == None: numGhosts = layout.getNumGhosts()
+    agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1) for i in range(numGhosts)]
+    game = rules.newGame( layout, agents[0], agents[1:], display, quiet )
+    replay = gameReplay.GameReplay( game.state, actions )
+    state = replay.getState( start )
     display.initialize(state.data)
 
-    for action in actions:
+    for n in range( start, len( actions ) ):
             # Execute the action
-        state = state.generateSuccessor( *action )
+        state = replay.getState( n + 1 )
         # Change the display
         display.update( state.data )
         # Allow for game specific conditions (winning, losing, etc.)
@@ -625,45 +888,192 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
+class GameRecord:
+    """
+    The outcome of one game played by runGames in a worker process: the
+    final state and the Game attributes the summary statistics use.
+    """
+    def __init__( self, index, seed, game ):
+        self.index = index
+        self.seed = seed
+        self.state = game.state
+        self.moveHistory = game.moveHistory
+        self.agentTimeout = game.agentTimeout
+        self.agentCrashed = game.agentCrashed
+        self.totalAgentTimes = game.totalAgentTimes
+        self.totalAgentTimeWarnings = game.totalAgentTimeWarnings
+        self.profile = game.profile
+        self.agentNames = getAgentNames( game )
+
+def getAgentNames( game ):
+    "The class names of a Game's agents"
+    return [agent.__class__.__name__ for agent in game.agents]
+
+def getGameSeed( seed, index ):
+    "The seed for game number index of a batch with base seed seed"
+    return random.Random('%s-%d' % (seed, index)).getrandbits(31)
+
+def summarizeGames( games, timed=True ):
+    """
+    Returns the summary statistics of a list of games (Game or GameRecord
+    objects): scores, wins, timeouts, crashes and the total time each agent
+    spent computing.  Game.run only times the agents when it catches their
+    exceptions; if the games were not timed, agentTimes is None.
+    """
+    numAgents = max([len(game.totalAgentTimes) for game in games] + [0])
+    agentTimes = None
+    if timed:
+        agentTimes = [sum([game.totalAgentTimes[i] for game in games if i < len(game.totalAgentTimes)]) for i in range(numAgents)]
+    return {'scores': [game.state.getScore() for game in games],
+            'wins': [game.state.isWin() for game in games].count(True),
+            'timeouts': [game.agentTimeout for game in games].count(True),
+            'crashes': [game.agentCrashed for game in games].count(True),
+            'agentTimes': agentTimes,
+            'games': games}
+
+class GameResults(list):
+    """
+    The games runGames played, in order, with their summary statistics
+    (see summarizeGames) in stats.
+    """
+    def __init__( self, games, stats ):
+        list.__init__( self, games )
+        self.stats = stats
+
+# Set in each worker process of a parallel runGames (see runGames)
+_batchGame = None
+
+def _initGameWorker( layout, pacman, ghosts, rules, catchExceptions, fastSim, profile ):
+    global _batchGame
+    _batchGame = (layout, pacman, ghosts, rules, catchExceptions, fastSim, profile)
+
+def _playGame( task ):
+    index, seed = task
+    layout, pacman, ghosts, rules, catchExceptions, fastSim, profile = _batchGame
+    import textDisplay
+    random.seed(seed)
+    game = rules.newGame( layout, pacman, ghosts, textDisplay.NullGraphics(), True, catchExceptions)
+    playGame( game, fastSim, profile )
+    return GameRecord(index, seed, game)
+
+def playGame( game, fastSim=False, profile=False ):
+    """
+    Runs a game with Game.run, or Game.runFast for fastSim.  With profile
+    the agents are profiled and game.profile is set to the report (see
+    searchProfiler.py).
+    """
+    profiler = None
+    if profile:
+        import searchProfiler
+        profiler = searchProfiler.SearchProfiler( game )
+        profiler.start()
+    try:
+        if fastSim: game.runFast()
+        else: game.run()
+    finally:
+        if profiler != None: game.profile = profiler.finish()
+
+def writeProfile( game, index ):
+    import json
+    f = open('profile-game-%d.json' % (index + 1), 'w')
+    try: json.dump(game.profile, f, indent=1)
+    finally: f.close()
+
+def recordGame( writer, layout, game, seed ):
+    """
+    Appends a Game or GameRecord to a gameRecords.GameRecordWriter
+    """
+    if isinstance( game, GameRecord ): agentNames = game.agentNames
+    else: agentNames = getAgentNames( game )
+    writer.write( layout, game.moveHistory, len( agentNames ), seed, game.state.getScore(),
+                  game.state.isWin(), agentNames )
+
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30, workers=0, seed=None, fastSim=False, profile=False, recordFile='recorded-games.pacrec' ):
+    """
+    Plays numGames games, prints their summary statistics and returns the
+    games as GameResults.
+
+    With a seed, game i is played with the random seed getGameSeed(seed, i),
+    so the games do not depend on how many were played before them.  With
+    workers > 0 the games after the training games are spread across that
+    many worker processes.  Workers play without a display and inherit the
+    agents as they are after training.  The games are returned as
+    GameRecords, in order, and always get their own seed (derived from the
+    current random state if no seed is given).
+
+    With fastSim the games are played by Game.runFast: no display, and
+    agent timeouts and exceptions are not caught.  With profile the
+    (non-training) games are profiled, each report is written to
+    profile-game-<n>.json and a summary is printed.
+
+    With record every game is appended to the game record archive
+    recordFile (see gameRecords.py).
+    """
     import __main__
     __main__.__dict__['_display'] = display
 
     rules = ClassicGameRules(timeout)
     games = []
-
-    for i in range( numGames ):
-        beQuiet = i < numTraining
-        if beQuiet:
-                # Suppress output and graphics
-            import textDisplay
-            gameDisplay = textDisplay.NullGraphics()
-            rules.quiet = True
-        else:
-            gameDisplay = display
-            rules.quiet = False
-        game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
-        game.run()
-        if not beQuiet: games.append(game)
-
-        if record:
-            import time, cPickle
-            fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = file(fname, 'w')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            cPickle.dump(components, f)
-            f.close()
-
+    if workers > 0 and seed is None:
+        seed = random.getrandbits(31)
+    writer = None
+    if record:
+        import gameRecords
+        writer = gameRecords.GameRecordWriter(recordFile)
+
+    try:
+        for i in range( numGames ):
+            beQuiet = i < numTraining
+            if workers > 0 and not beQuiet:
+                import multiprocessing
+                rules.quiet = True
+                pool = multiprocessing.Pool(workers, _initGameWorker, (layout, pacman, ghosts, rules, catchExceptions, fastSim, profile))
+                try:
+                    tasks = [(j, getGameSeed(seed, j)) for j in range(i, numGames)]
+                    for game in pool.imap(_playGame, tasks):
+                        games.append(game)
+                        if writer != None: recordGame(writer, layout, game, game.seed)
+                        if profile: writeProfile(game, game.index)
+                finally:
+                    pool.terminate()
+                break
+            if beQuiet:
+                    # Suppress output and graphics
+                import textDisplay
+                gameDisplay = textDisplay.NullGraphics()
+                rules.quiet = True
+            else:
+                gameDisplay = display
+                rules.quiet = False
+            gameSeed = None
+            if seed is not None:
+                gameSeed = getGameSeed(seed, i)
+                random.seed(gameSeed)
+            game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
+            playGame( game, fastSim, profile and not beQuiet )
+            if not beQuiet: games.append(game)
+            if game.profile != None: writeProfile(game, i)
+
+            if writer != None: recordGame(writer, layout, game, gameSeed)
+    finally:
+        if writer != None: writer.close()
+
+    stats = summarizeGames(games, catchExceptions and not fastSim)
     if (numGames-numTraining) > 0:
-        scores = [game.state.getScore() for game in games]
-        wins = [game.state.isWin() for game in games]
-        winRate = wins.count(True)/ float(len(wins))
+        scores = stats['scores']
+        winRate = stats['wins'] / float(len(games))
         print 'Average Score:', sum(scores) / float(len(scores))
         print 'Scores:       ', ', '.join([str(score) for score in scores])
-        print 'Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate)
-        print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins])
-
-    return games
+        print 'Win Rate:      %d/%d (%.2f)' % (stats['wins'], len(games), winRate)
+        print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(game.state.isWin())] for game in games])
+        print 'Timeouts:      %d, Crashes: %d' % (stats['timeouts'], stats['crashes'])
+        if stats['agentTimes'] != None:
+            print 'Agent times:  ', ', '.join(['%.2f' % t for t in stats['agentTimes']])
+        if profile:
+            import searchProfiler
+            searchProfiler.printSummary([game.profile for game in games])
+
+    return GameResults(games, stats)
 
 if __name__ == '__main__':
     """
@@ -0,0 +1,188 @@
+# searchProfiler.py
+# -----------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Opt-in instrumentation of the search agents in a game.
+
+While a SearchProfiler is started it wraps GameState.generateSuccessor and
+GameState.getLegalActions, and each agent's getAction and
+evaluationFunction.  For every move it records:
+
+  nodes         successors generated during the move
+  nodesByDepth  the same by plies below the state the agent was given
+  nodesByAgent  the same by the agent that moved
+  expanded      getLegalActions calls
+  evalCalls     evaluation function calls
+  rulesTime, evalTime, agentTime
+                getAction's time split between the game rules, the
+                evaluation function and the agent's own code (each
+                excluding what it calls of the others)
+  branching     the effective branching factor: the b for which
+                b + b^2 + ... + b^depth equals nodes
+
+runGames(..., profile=True) (pacman.py --profile) profiles every game,
+writes each report to profile-game-<n>.json and prints a summary.
+"""
+
+import time
+
+def effectiveBranching( nodes, depth ):
+    "Solves b + b^2 + ... + b^depth = nodes for b by bisection"
+    if nodes == 0 or depth == 0: return 0.0
+    low, high = 0.0, float(nodes)
+    for i in range(60):
+        b = (low + high) / 2
+        total, power = 0.0, 1.0
+        for d in range(depth):
+            power *= b
+            total += power
+        if total < nodes: low = b
+        else: high = b
+    return (low + high) / 2
+
+class SearchProfiler:
+    """
+    Profiles the agents of one game between start() and finish().  Only
+    one profiler can be started at a time.
+    """
+
+    def __init__( self, game ):
+        # the game's own GameState class: pacman.py may be running as __main__
+        self.stateClass = game.state.__class__
+        self.agents = game.agents
+        self.moves = []
+        self.current = None
+        self.stack = []
+        self.saved = []
+
+    def start( self ):
+        profiler = self
+        GameState = self.stateClass
+        generateSuccessor = GameState.__dict__['generateSuccessor']
+        getLegalActions = GameState.__dict__['getLegalActions']
+
+        def profiledGenerateSuccessor( state, agentIndex, action ):
+            child = profiler.timed( 'rulesTime', generateSuccessor, (state, agentIndex, action) )
+            move = profiler.current
+            if move != None:
+                depth = child.data._ply - move['ply']
+                byDepth, byAgent = move['nodesByDepth'], move['nodesByAgent']
+                while len(byDepth) <= depth: byDepth.append(0)
+                byDepth[depth] += 1
+                byAgent[agentIndex] += 1
+                move['nodes'] += 1
+            return child
+
+        def profiledGetLegalActions( state, agentIndex=0 ):
+            if profiler.current != None: profiler.current['expanded'] += 1
+            return profiler.timed( 'rulesTime', getLegalActions, (state, agentIndex) )
+
+        self.saved.append( (GameState, 'generateSuccessor', generateSuccessor) )
+        self.saved.append( (GameState, 'getLegalActions', getLegalActions) )
+        GameState.generateSuccessor = profiledGenerateSuccessor
+        GameState.getLegalActions = profiledGetLegalActions
+        for index, agent in enumerate(self.agents):
+            self.watch( index, agent )
+
+    def watch( self, index, agent ):
+        profiler = self
+        getAction = agent.getAction
+        def profiledGetAction( state ):
+            return profiler.profileMove( index, getAction, state )
+        self.saved.append( (agent, 'getAction', agent.__dict__.get('getAction')) )
+        agent.getAction = profiledGetAction
+
+        if hasattr(agent, 'evaluationFunction'):
+            evaluationFunction = agent.evaluationFunction
+            def profiledEvaluationFunction( *args ):
+                if profiler.current != None: profiler.current['evalCalls'] += 1
+                return profiler.timed( 'evalTime', evaluationFunction, args )
+            self.saved.append( (agent, 'evaluationFunction', agent.__dict__.get('evaluationFunction')) )
+            agent.evaluationFunction = profiledEvaluationFunction
+
+    def timed( self, category, function, args ):
+        """
+        Calls function, charging its time (less the time of profiled calls
+        it makes itself) to category of the current move.
+        """
+        start = time.time()
+        self.stack.append( 0.0 )
+        try:
+            return function( *args )
+        finally:
+            elapsed = time.time() - start
+            inner = self.stack.pop()
+            if self.stack: self.stack[-1] += elapsed
+            if self.current != None: self.current[category] += elapsed - inner
+
+    def profileMove( self, index, getAction, state ):
+        move = {'agent': index, 'ply': state.data._ply, 'nodes': 0, 'nodesByDepth': [0],
+                'nodesByAgent': [0] * state.getNumAgents(), 'expanded': 0, 'evalCalls': 0,
+                'rulesTime': 0.0, 'evalTime': 0.0}
+        self.current = move
+        start = time.time()
+        try:
+            return getAction( state )
+        finally:
+            move['time'] = time.time() - start
+            move['agentTime'] = move['time'] - move['rulesTime'] - move['evalTime']
+            move['branching'] = effectiveBranching( move['nodes'], len(move['nodesByDepth']) - 1 )
+            self.moves.append( move )
+            self.current = None
+
+    def finish( self ):
+        """
+        Restores the wrapped methods and returns the game's report: the
+        agents, every move's record and the per-agent totals.
+        """
+        while self.saved:
+            owner, name, original = self.saved.pop()
+            if original == None and owner is not self.stateClass: delattr( owner, name )
+            else: setattr( owner, name, original )
+        return {'agents': [agent.__class__.__name__ for agent in self.agents],
+                'moves': self.moves,
+                'totals': summarizeMoves( self.moves, len(self.agents) )}
+
+def summarizeMoves( moves, numAgents ):
+    """
+    Per-agent totals over a list of move records: moves, time in each part,
+    nodes, expanded nodes, evaluation calls and the mean effective
+    branching factor.
+    """
+    totals = []
+    for index in range(numAgents):
+        agentMoves = [move for move in moves if move['agent'] == index]
+        total = {'agent': index, 'moves': len(agentMoves)}
+        for key in ['time', 'rulesTime', 'evalTime', 'agentTime', 'nodes', 'expanded', 'evalCalls']:
+            total[key] = sum([move[key] for move in agentMoves])
+        searched = [move['branching'] for move in agentMoves if move['nodes'] > 0]
+        total['branching'] = sum(searched) / max(1, len(searched))
+        totals.append( total )
+    return totals
+
+def printSummary( reports ):
+    "Prints the per-agent totals over the reports of several games"
+    moves = []
+    for report in reports: moves.extend( report['moves'] )
+    names = reports[0]['agents']
+    print 'Search profile over %d game(s):' % len(reports)
+    for total in summarizeMoves( moves, len(names) ):
+        if total['moves'] == 0: continue
+        perMove = 1.0 / total['moves']
+        elapsed = max( total['time'], 1e-9 )
+        print '  Agent %d (%s): %d moves, %.4fs/move, %.1f nodes/move, %.1f evals/move, branching %.2f' % \
+            (total['agent'], names[total['agent']], total['moves'], total['time'] * perMove,
+             total['nodes'] * perMove, total['evalCalls'] * perMove, total['branching'])
+        print '    time in rules %.0f%%, evaluation %.0f%%, agent %.0f%%' % \
+            (100 * total['rulesTime'] / elapsed, 100 * total['evalTime'] / elapsed, 100 * total['agentTime'] / elapsed)
@@ -0,0 +1,161 @@
+# stateBenchmark.py
+# -----------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Measures what one expanded search node costs: the memory and the number of
+objects a successor GameState allocates beyond what it shares with its
+predecessor, and how many successors are generated per second.
+
+Each figure is given for GameState.generateSuccessor and for a reference:
+the same successor built the way successors were before they were slotted
+and shared state with their parent.  The reference copies every agent
+state, the capsule list and the food grid object (as GameStateData's copy
+constructor used to), and charges each slotted object the __dict__ of its
+attributes.
+
+It also times reading food cells, which evaluation functions and move
+ordering do far more often than they copy a grid: grid[x][y] on the old
+list-of-lists Grid and on the BitGrid, BitGrid.get(x, y), and
+GameState.hasFood.
+
+> python stateBenchmark.py [layout] [nodes]
+"""
+
+from pacman import GameState
+from game import Grid
+import layout
+import gc, random, sys, time
+
+def copiedSuccessor( state, agentIndex, action ):
+    """
+    The reference successor: generateSuccessor's, with nothing shared with
+    state but the layout.
+    """
+    child = state.generateSuccessor(agentIndex, action)
+    data = child.data
+    data.agentStates = data.copyAgentStates(data.agentStates)
+    data._sharedAgentStates = [None for agentState in data.agentStates]
+    data.capsules = data.capsules[:]
+    data.food = data.food.shallowCopy()
+    return child
+
+def nodeCost( state, parent, withDicts=False ):
+    """
+    Returns the bytes of the objects state owns that parent does not share,
+    and how many of them are slotted.  withDicts adds a __dict__ holding
+    each slotted object's attributes to its size.
+    """
+    counts = {'slotted': 0}
+    def size(obj):
+        total = sys.getsizeof(obj)
+        if hasattr(obj, '__dict__'): total += sys.getsizeof(obj.__dict__)
+        elif hasattr(obj, '__slots__'):
+            counts['slotted'] += 1
+            if withDicts: total += sys.getsizeof(dict.fromkeys(obj.__slots__))
+        return total
+    data, parentData = state.data, parent.data
+    total = size(state) + size(data) + sys.getsizeof(data.agentStates)
+    if data._eaten is not parentData._eaten: total += sys.getsizeof(data._eaten)
+    if data.capsules is not parentData.capsules: total += sys.getsizeof(data.capsules)
+    if data.food is not parentData.food: total += size(data.food)
+    for agentState, parentAgentState in zip(data.agentStates, parentData.agentStates):
+        if agentState is parentAgentState: continue
+        total += size(agentState)
+        if agentState.configuration is not parentAgentState.configuration:
+            total += size(agentState.configuration) + sys.getsizeof(agentState.configuration.pos)
+    return total, counts['slotted']
+
+def expand( state, numNodes, seed, successor=GameState.generateSuccessor ):
+    """
+    Returns (parent, child) pairs for numNodes successors, generated the way
+    a search expands nodes: every successor of a state along a random game.
+    """
+    rand = random.Random(seed)
+    start, pairs, agentIndex = state, [], 0
+    while len(pairs) < numNodes:
+        if state.isWin() or state.isLose():
+            state, agentIndex = start, 0
+        actions = state.getLegalActions(agentIndex)
+        children = [successor(state, agentIndex, action) for action in actions]
+        pairs.extend([(state, child) for child in children])
+        state = rand.choice(children)
+        agentIndex = (agentIndex + 1) % state.getNumAgents()
+    return pairs[:numNodes]
+
+def measure( start, numNodes, seed, successor, withDicts ):
+    """
+    Returns the bytes and GC-tracked objects per node (a slotted object
+    counts a __dict__ as one more object with withDicts) and the successors
+    generated per second.
+    """
+    startTime = time.time()
+    expand(start, numNodes, seed, successor)
+    elapsed = time.time() - startTime
+
+    gc.collect()
+    before = len(gc.get_objects())
+    pairs = expand(start, numNodes, seed, successor)
+    gc.collect()
+    objects = len(gc.get_objects()) - before - 1
+    bytes = 0
+    for parent, child in pairs:
+        childBytes, slotted = nodeCost(child, parent, withDicts)
+        bytes += childBytes
+        if withDicts: objects += slotted
+    return bytes / float(numNodes), objects / float(numNodes), numNodes / elapsed
+
+def measureReads( state, numReads ):
+    """
+    Returns (name, food cells read per second) for each way of reading the
+    food: numReads reads, sweeping the board.
+    """
+    food = state.data.food
+    grid = Grid(food.width, food.height)
+    for x, y in food.asList(): grid[x][y] = True
+    cells = [(x, y) for x in range(food.width) for y in range(food.height)]
+    cells = (cells * (numReads / len(cells) + 1))[:numReads]
+    def index(g):
+        for x, y in cells: g[x][y]
+    def get(g):
+        for x, y in cells: g.get(x, y)
+    def hasFood(s):
+        for x, y in cells: s.hasFood(x, y)
+    rates = []
+    for name, read, arg in [('Grid grid[x][y]', index, grid), ('BitGrid grid[x][y]', index, food),
+                            ('BitGrid.get(x, y)', get, food), ('GameState.hasFood', hasFood, state)]:
+        startTime = time.time()
+        read(arg)
+        rates.append((name, numReads / (time.time() - startTime)))
+    return rates
+
+def runBenchmark( layoutName='mediumClassic', numNodes=20000, seed=0 ):
+    start = GameState()
+    start.initialize(layout.getLayout(layoutName), 2)
+    current = measure(start, numNodes, seed, GameState.generateSuccessor, False)
+    reference = measure(start, numNodes, seed, copiedSuccessor, True)
+
+    print 'Layout %s, %d nodes' % (layoutName, numNodes)
+    print '                       reference  current  saved'
+    for name, format, i in [('Bytes per node', '%9.1f', 0), ('GC objects per node', '%9.2f', 1)]:
+        print '%-22s %s %s  %4.0f%%' % (name, format % reference[i], (format[:1] + '7' + format[2:]) % current[i],
+                                      100 * (1 - current[i] / reference[i]))
+    print '%-22s %9.0f %7.0f' % ('Successors per second', reference[2], current[2])
+    print
+    print 'Food cell reads per second'
+    for name, rate in measureReads(start, 50 * numNodes):
+        print '%-22s %9.0f' % (name, rate)
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    runBenchmark(*([args[0]] if args else []) + [int(a) for a in args[1:2]])